@@ -0,0 +1,143 @@
+"""
+Пакетная запись через API: каждый элемент проверяется той же
+формой, что и в HTML-версии (PostForm, CommentForm), прошедшие
+проверку пишутся одним bulk_create в одной транзакции, а в ответе
+есть результат для каждого элемента в исходном порядке.
+"""
+from django.db import transaction
+
+from posts import bulk
+from posts.forms import CommentForm, PostForm
+from posts.models import Comment, Follow, Post, User
+
+from .resources import ApiError
+
+MAX_ITEMS = 500
+
+
+def _items(payload):
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ApiError('Ожидается непустой список items')
+    if len(items) > MAX_ITEMS:
+        raise ApiError(f'Не больше {MAX_ITEMS} элементов за запрос')
+    if not all(isinstance(item, dict) for item in items):
+        raise ApiError('Каждый элемент должен быть объектом')
+    return items
+
+
+def _value(item, key, kind):
+    """Значение поля нужного типа или None: ключ не сломает set/dict."""
+    value = item.get(key)
+    if isinstance(value, bool) or not isinstance(value, kind):
+        return None
+    return value
+
+
+def _invalid(errors):
+    return {'status': 'invalid', 'errors': errors}
+
+
+def _form_errors(form):
+    return {
+        field: [error['message'] for error in errors]
+        for field, errors in form.errors.get_json_data().items()
+    }
+
+
+def create_posts(user, payload):
+    results, posts = [], []
+    for item in _items(payload):
+        form = PostForm(data=item)
+        if not form.is_valid():
+            results.append(_invalid(_form_errors(form)))
+            continue
+        post = form.save(commit=False)
+        post.author = user
+        posts.append(post)
+        results.append(post)
+    with transaction.atomic():
+        bulk.create_posts(posts)
+    return [
+        {'status': 'created', 'id': result.pk}
+        if isinstance(result, Post) else result
+        for result in results
+    ]
+
+
+def create_comments(user, payload):
+    items = _items(payload)
+    existing = set(Post.objects.filter(
+        pk__in={_value(item, 'post', int) for item in items} - {None}
+    ).values_list('pk', flat=True))
+    results, comments = [], []
+    for item in items:
+        form = CommentForm(data=item)
+        valid = form.is_valid()
+        errors = _form_errors(form)
+        if _value(item, 'post', int) not in existing:
+            valid = False
+            errors['post'] = ['Запись не найдена']
+        if not valid:
+            results.append(_invalid(errors))
+            continue
+        comment = form.save(commit=False)
+        comment.author = user
+        comment.post_id = item['post']
+        comments.append(comment)
+        results.append(comment)
+    with transaction.atomic():
+        bulk.create_comments(comments)
+    return [
+        {'status': 'created', 'id': result.pk}
+        if isinstance(result, Comment) else result
+        for result in results
+    ]
+
+
+def change_follows(user, payload):
+    """Элементы {author, action}, action — follow (умолчание) или unfollow."""
+    items = _items(payload)
+    authors = {
+        author.username: author
+        for author in User.objects.filter(
+            username__in={_value(item, 'author', str) for item in items}
+            - {None}
+        )
+    }
+    following = set(user.follower.filter(
+        author__in=authors.values()
+    ).values_list('author__username', flat=True))
+
+    results, follows, unfollow, seen = [], [], [], set()
+    for item in items:
+        username = _value(item, 'author', str)
+        action = item.get('action', 'follow')
+        if action not in ('follow', 'unfollow'):
+            results.append(_invalid({'action': ['follow или unfollow']}))
+        elif username not in authors:
+            results.append(_invalid({'author': ['Автор не найден']}))
+        elif username in seen:
+            results.append(
+                _invalid({'author': ['Автор уже есть в пакете']})
+            )
+        elif username == user.username:
+            results.append(
+                _invalid({'author': ['Нельзя подписаться на себя']})
+            )
+        elif action == 'follow' and username in following:
+            results.append({'status': 'exists'})
+        elif action == 'unfollow' and username not in following:
+            results.append({'status': 'missing'})
+        elif action == 'follow':
+            follows.append(Follow(user=user, author=authors[username]))
+            results.append({'status': 'followed'})
+        else:
+            unfollow.append(authors[username])
+            results.append({'status': 'unfollowed'})
+        seen.add(username)
+    with transaction.atomic():
+        bulk.create_follows(follows)
+        # удаление через queryset отправляет сигналы по каждой подписке
+        user.follower.filter(author__in=unfollow).delete()
+    return results
@@ -0,0 +1,116 @@
+"""
+Описание ресурсов API: какие поля можно запросить через ?fields=,
+из каких колонок .values() они берутся и по какому ключу идёт
+курсорная навигация. Внешние ключи отдаются через JOIN в том же
+запросе (author__username, group__slug), экземпляры моделей не
+создаются.
+"""
+from django.core.files.storage import default_storage
+
+from posts.pagination import FEED_KEYS
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Resource:
+    def __init__(self, fields, default=None, keys=('id',), convert=None):
+        # fields: имя в ответе -> путь для .values()
+        self.fields = fields
+        self.default = default or list(fields)
+        self.keys = keys
+        self.convert = convert or {}
+
+    def requested(self, request):
+        """Поля из ?fields=id,text или поля по умолчанию."""
+        raw = request.GET.get('fields')
+        if not raw:
+            return self.default
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise ApiError(
+                f'Неизвестные поля: {", ".join(unknown) or raw}. '
+                f'Доступны: {", ".join(self.fields)}'
+            )
+        return names
+
+    def values(self, queryset, names):
+        """queryset.values() только с нужными колонками и ключом."""
+        paths = [self.fields[name] for name in names]
+        for key in self.keys:
+            if key.lstrip('-') not in paths:
+                paths.append(key.lstrip('-'))
+        return queryset.values(*paths)
+
+    def serialize(self, row, names):
+        result = {}
+        for name in names:
+            value = row[self.fields[name]]
+            if name in self.convert:
+                value = self.convert[name](value)
+            result[name] = value
+        return result
+
+
+POSTS = Resource(
+    {
+        'id': 'id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'image': 'image',
+        'comment_count': 'comment_count',
+    },
+    keys=FEED_KEYS,
+    convert={'image': _media_url},
+)
+
+COMMENTS = Resource(
+    {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    },
+    keys=('created', 'id'),
+)
+
+GROUPS = Resource(
+    {
+        'id': 'id',
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+    },
+)
+
+FOLLOWS = Resource(
+    {
+        'id': 'id',
+        'user': 'user__username',
+        'author': 'author__username',
+    },
+)
+
+PROFILES = Resource(
+    {
+        'username': 'username',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'posts_count': 'stats__posts_count',
+        'followers_count': 'stats__followers_count',
+        'following_count': 'stats__following_count',
+    },
+    keys=(),
+)
@@ -0,0 +1,262 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import (
+    Comment, Follow, Group, Post, TimelineEntry, User
+)
+from posts.tests import QueryPlanMixin
+
+
+class ReadApiTest(QueryPlanMixin, TestCase):
+    SCAN_ALLOWED = ('posts_group',)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='writer')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Api group', slug='api-group', description='Api group'
+        )
+        self.posts = [
+            Post.objects.create(
+                text=f'post {i}', author=self.author,
+                group=self.group if i % 2 else None
+            )
+            for i in range(15)
+        ]
+        Comment.objects.create(
+            post=self.posts[-1], author=self.reader, text='api comment'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def get(self, name, query=None, **kwargs):
+        return self.client.get(reverse(f'api:{name}', kwargs=kwargs), query)
+
+    def test_post_list_pages(self):
+        """Список записей листается курсором одним запросом на страницу"""
+        with self.assertNumQueries(1):
+            first = self.get('post_list').json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertEqual(first['results'][0]['text'], 'post 14')
+        self.assertEqual(first['results'][0]['author'], 'writer')
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [row['text'] for row in second['results']],
+            [f'post {i}' for i in range(4, -1, -1)]
+        )
+        self.assertIsNone(second['next'])
+
+    def test_sparse_fields_and_filters(self):
+        """?fields= отдаёт только запрошенные поля"""
+        data = self.get(
+            'post_list', {'fields': 'id,text', 'group': 'api-group'}
+        ).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        self.assertEqual(len(data['results']), 7)
+        response = self.get('post_list', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_detail_endpoints(self):
+        """Запись, группа, комментарии, подписки и профиль"""
+        post = self.get('post_detail', post_id=self.posts[-1].id).json()
+        self.assertEqual(post['comment_count'], 1)
+        self.assertEqual(post['group'], None)
+        self.assertEqual(
+            self.get('post_detail', post_id=999).status_code, 404
+        )
+        comments = self.get('comment_list', post_id=self.posts[-1].id).json()
+        self.assertEqual(comments['results'][0]['text'], 'api comment')
+        self.assertEqual(
+            self.get('group_detail', slug='api-group').json()['title'],
+            'Api group'
+        )
+        follows = self.get('follow_list', {'user': 'reader'}).json()
+        self.assertEqual(follows['results'][0]['author'], 'writer')
+        profile = self.get('profile_detail', username='writer').json()
+        self.assertEqual(profile['posts_count'], 15)
+        self.assertEqual(profile['followers_count'], 1)
+
+    def test_etag(self):
+        """Повторный запрос с ETag получает 304, изменения — 200"""
+        response = self.get('post_list')
+        etag = response['ETag']
+        response = self.client.get(
+            reverse('api:post_list'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='newest', author=self.author)
+        response = self.client.get(
+            reverse('api:post_list'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_plans(self):
+        """Запросы API читают таблицы по индексам без сортировки"""
+        post_id = self.posts[-1].id
+        for name, query, kwargs in (
+            ('post_list', None, {}),
+            ('post_list', {'author': 'writer'}, {}),
+            ('post_list', {'group': 'api-group'}, {}),
+            ('post_detail', None, {'post_id': post_id}),
+            ('comment_list', None, {'post_id': post_id}),
+            ('group_list', None, {}),
+            ('follow_list', {'user': 'reader'}, {}),
+            ('follow_list', {'author': 'writer'}, {}),
+            ('profile_detail', None, {'username': 'writer'}),
+        ):
+            with self.subTest(name=name, query=query):
+                url = reverse(f'api:{name}', kwargs=kwargs)
+                first = self.assertPlans(url, data=query).json()
+                if first.get('next'):
+                    self.assertPlans(first['next'])
+
+    def test_read_only(self):
+        """API только для чтения"""
+        response = self.client.post(reverse('api:post_list'))
+        self.assertEqual(response.status_code, 405)
+
+
+class BatchApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='bot', password='s12crac##kle345'
+        )
+        self.author = User.objects.create_user(username='followed')
+        self.group = Group.objects.create(
+            title='Batch group', slug='batch', description='Batch group'
+        )
+        self.auth = 'Basic ' + base64.b64encode(
+            b'bot:s12crac##kle345'
+        ).decode()
+
+    def post(self, name, payload, **extra):
+        extra.setdefault('HTTP_AUTHORIZATION', self.auth)
+        return self.client.post(
+            reverse(f'api:{name}'), json.dumps(payload),
+            content_type='application/json', **extra
+        )
+
+    def test_posts(self):
+        """Пакет записей проверяется PostForm и пишется целиком"""
+        Follow.objects.create(user=self.author, author=self.user)
+        index = self.client.get(reverse('index'))
+        response = self.post('batch_posts', {'items': [
+            {'text': 'first batch post', 'group': self.group.id},
+            {'text': ''},
+            {'text': 'second batch post'},
+        ]})
+        results = response.json()['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'invalid', 'created']
+        )
+        self.assertIn('text', results[1]['errors'])
+        first = Post.objects.get(pk=results[0]['id'])
+        self.assertEqual(first.text, 'first batch post')
+        self.assertEqual(first.group, self.group)
+        self.assertEqual(self.user.stats.posts_count, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.author).count(), 2
+        )
+        response = self.client.get(reverse('search'), {'q': 'second'})
+        self.assertContains(response, 'second batch post')
+        index = self.client.get(reverse('index'))
+        self.assertContains(index, 'first batch post')
+
+    def test_comments(self):
+        """Комментарии обновляют счётчик и карточку записи"""
+        post = Post.objects.create(text='Commented', author=self.author)
+        self.client.get(reverse('index'))
+        response = self.post('batch_comments', [
+            {'post': post.id, 'text': 'one'},
+            {'post': post.id, 'text': 'two'},
+            {'post': 999, 'text': 'lost'},
+            {'post': [1], 'text': 'broken'},
+        ])
+        statuses = [r['status'] for r in response.json()['results']]
+        self.assertEqual(
+            statuses, ['created', 'created', 'invalid', 'invalid']
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+        self.assertContains(
+            self.client.get(reverse('index')), 'Количество комментариев 2'
+        )
+
+    def test_follows(self):
+        """Подписки и отписки в одном пакете"""
+        other = User.objects.create_user(username='unfollowed')
+        Follow.objects.create(user=self.user, author=other)
+        Post.objects.create(text='Backfilled', author=self.author)
+        response = self.post('batch_follows', {'items': [
+            {'author': 'followed'},
+            {'author': 'unfollowed', 'action': 'unfollow'},
+            {'author': 'bot'},
+            {'author': 'nobody'},
+        ]})
+        statuses = [r['status'] for r in response.json()['results']]
+        self.assertEqual(
+            statuses, ['followed', 'unfollowed', 'invalid', 'invalid']
+        )
+        self.assertEqual(
+            list(self.user.follower.values_list('author__username',
+                                                flat=True)),
+            ['followed']
+        )
+        self.assertEqual(self.user.stats.following_count, 1)
+        self.assertEqual(self.user.timeline.count(), 1)
+
+    def test_auth(self):
+        """Без авторизации и с сессией без CSRF запись запрещена"""
+        response = self.post('batch_posts', [{'text': 'x'}],
+                             HTTP_AUTHORIZATION='')
+        self.assertEqual(response.status_code, 401)
+        csrf_client = Client(enforce_csrf_checks=True)
+        csrf_client.force_login(self.user)
+        response = csrf_client.post(
+            reverse('api:batch_posts'), json.dumps([{'text': 'x'}]),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Post.objects.exists())
+
+
+class ExportApiTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.staff = User.objects.create_user(
+            username='staff', password='s12crac##kle345', is_staff=True
+        )
+        post = Post.objects.create(text='streamed', author=self.staff)
+        Comment.objects.create(post=post, author=self.staff, text='dumped')
+
+    def test_stream(self):
+        """Выгрузка доступна сотрудникам и отдаётся потоком"""
+        url = reverse('api:export_posts')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(rows[0]['text'], 'streamed')
+        response = self.client.get(
+            reverse('api:export_comments'), {'format': 'csv'}
+        )
+        self.assertIn(
+            'dumped', b''.join(response.streaming_content).decode()
+        )
+        response = self.client.get(url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,29 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('batch/posts/', views.batch_posts, name='batch_posts'),
+    path('batch/comments/', views.batch_comments, name='batch_comments'),
+    path('batch/follows/', views.batch_follows, name='batch_follows'),
+    path('export/posts/', views.export, {'kind': 'posts'},
+         name='export_posts'),
+    path('export/comments/', views.export, {'kind': 'comments'},
+         name='export_comments'),
+    path('posts/', views.post_list, name='post_list'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comment_list,
+        name='comment_list'
+    ),
+    path('groups/', views.group_list, name='group_list'),
+    path('groups/<slug:slug>/', views.group_detail, name='group_detail'),
+    path('follows/', views.follow_list, name='follow_list'),
+    path(
+        'profiles/<username>/',
+        views.profile_detail,
+        name='profile_detail'
+    ),
+]
@@ -0,0 +1,241 @@
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+
+from django.contrib.auth import authenticate
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+)
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag
+)
+from django.views.decorators.csrf import csrf_exempt
+
+from posts import export as exporter
+from posts.counters import stats_for
+from posts.models import Comment, Follow, Group, Post, User
+from posts.pagination import PAGE_SIZE, paginate
+
+from . import batch
+from .resources import (
+    COMMENTS, FOLLOWS, GROUPS, POSTS, PROFILES, ApiError
+)
+
+MAX_LIMIT = 100
+
+
+def api_view(view):
+    """
+    Оборачивает view, возвращающую данные, в JSON-ответ с ETag:
+    совпавший If-None-Match получает 304 без тела.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse(
+                {'error': 'Метод не поддерживается'}, status=405
+            )
+        try:
+            data = view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': error.message}, status=error.status)
+        except Http404:
+            return JsonResponse({'error': 'Не найдено'}, status=404)
+        body = json.dumps(
+            data, cls=DjangoJSONEncoder, ensure_ascii=False
+        ).encode()
+        etag = quote_etag(hashlib.md5(body).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+    return wrapped
+
+
+def _basic_auth(request):
+    """Пользователь из заголовка Authorization: Basic или None."""
+    method, _, credentials = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    if method.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(credentials).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    username, _, password = decoded.partition(':')
+    return authenticate(request, username=username, password=password)
+
+
+def api_write(view):
+    """
+    POST с JSON-телом от пользователя, вошедшего через HTTP Basic
+    или через сессию; для сессии проверяется CSRF, как у форм.
+    """
+    @csrf_exempt
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse(
+                {'error': 'Метод не поддерживается'}, status=405
+            )
+        user = _basic_auth(request)
+        if user is None and request.user.is_authenticated:
+            rejected = CsrfViewMiddleware().process_view(
+                request, None, (), {}
+            )
+            if rejected is not None:
+                return JsonResponse({'error': 'Ошибка CSRF'}, status=403)
+            user = request.user
+        if user is None:
+            response = JsonResponse(
+                {'error': 'Нужна авторизация'}, status=401
+            )
+            response['WWW-Authenticate'] = 'Basic realm="api"'
+            return response
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Тело не JSON'}, status=400)
+        try:
+            results = view(user, payload)
+        except ApiError as error:
+            return JsonResponse({'error': error.message}, status=error.status)
+        return JsonResponse({'results': results})
+    return wrapped
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _link(request, query):
+    return request.build_absolute_uri(f'?{query}') if query else None
+
+
+def _list(request, resource, queryset):
+    names = resource.requested(request)
+    paginator, page = paginate(
+        request,
+        resource.values(queryset, names),
+        keys=resource.keys,
+        per_page=_limit(request)
+    )
+    return {
+        'results': [resource.serialize(row, names) for row in page],
+        'next': _link(request, page.next_query),
+        'previous': _link(request, page.prev_query),
+    }
+
+
+def _detail(resource, request, queryset):
+    names = resource.requested(request)
+    row = resource.values(queryset, names).first()
+    if row is None:
+        raise Http404
+    return resource.serialize(row, names)
+
+
+@api_view
+def post_list(request):
+    posts = Post.objects.all()
+    if request.GET.get('author'):
+        posts = posts.filter(author__username=request.GET['author'])
+    if request.GET.get('group'):
+        posts = posts.filter(group__slug=request.GET['group'])
+    return _list(request, POSTS, posts)
+
+
+@api_view
+def post_detail(request, post_id):
+    return _detail(POSTS, request, Post.objects.filter(pk=post_id))
+
+
+@api_view
+def comment_list(request, post_id):
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return _list(request, COMMENTS, Comment.objects.filter(post_id=post_id))
+
+
+@api_view
+def group_list(request):
+    return _list(request, GROUPS, Group.objects.all())
+
+
+@api_view
+def group_detail(request, slug):
+    return _detail(GROUPS, request, Group.objects.filter(slug=slug))
+
+
+@api_view
+def follow_list(request):
+    follows = Follow.objects.all()
+    if request.GET.get('user'):
+        follows = follows.filter(user__username=request.GET['user'])
+    if request.GET.get('author'):
+        follows = follows.filter(author__username=request.GET['author'])
+    return _list(request, FOLLOWS, follows)
+
+
+@api_view
+def profile_detail(request, username):
+    profile = _detail(
+        PROFILES, request, User.objects.filter(username=username)
+    )
+    counters = [name for name in profile if name.endswith('_count')]
+    if any(profile[name] is None for name in counters):
+        # строки UserStats ещё нет: счётчики пересчитываются
+        stats = stats_for(User.objects.get(username=username))
+        for name in counters:
+            profile[name] = getattr(stats, name)
+    return profile
+
+
+batch_posts = api_write(batch.create_posts)
+batch_comments = api_write(batch.create_comments)
+batch_follows = api_write(batch.change_follows)
+
+
+def export(request, kind):
+    """
+    Потоковая выгрузка записей или комментариев для сотрудников:
+    ?format=ndjson|csv, фильтры author, group, since, until.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
+    user = _basic_auth(request) or request.user
+    if not user.is_authenticated:
+        response = JsonResponse({'error': 'Нужна авторизация'}, status=401)
+        response['WWW-Authenticate'] = 'Basic realm="api"'
+        return response
+    if not user.is_staff:
+        return JsonResponse({'error': 'Только для сотрудников'}, status=403)
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in exporter.FORMATS:
+        return JsonResponse({'error': 'format: ndjson или csv'}, status=400)
+    try:
+        lines = exporter.stream(
+            kind, fmt,
+            **{name: request.GET.get(name)
+               for name in ('author', 'group', 'since', 'until')}
+        )
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    response = StreamingHttpResponse(
+        lines, content_type=exporter.FORMATS[fmt]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}.{fmt}"'
+    )
+    return response
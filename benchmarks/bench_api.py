@@ -0,0 +1,83 @@
+"""
+Пропускная способность JSON API против HTML-страниц лент.
+
+Страницы запрашиваются тестовым клиентом в одном процессе;
+кэш страниц сбрасывается перед каждым запросом, чтобы сравнивать
+построение ответа, а не чтение из кэша.
+
+    python -m benchmarks.bench_api --posts 10000
+"""
+import argparse
+import time
+
+from benchmarks.common import report, setup_django
+
+
+def seed(total):
+    from django.contrib.auth import get_user_model
+    from posts.models import Group, Post
+
+    author = get_user_model().objects.create_user(username='bench')
+    group = Group.objects.create(title='Bench', slug='bench',
+                                 description='Bench')
+    batch = 5000
+    for start in range(0, total, batch):
+        Post.objects.bulk_create(
+            Post(text=f'post {i} ' * 30, author=author,
+                 group=group if i % 2 else None)
+            for i in range(start, min(start + batch, total))
+        )
+
+
+def throughput(client, url, seconds, clear):
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if clear:
+            clear()
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        done += 1
+    return done / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.test import Client
+
+    # иначе на каждый ответ работает debug_toolbar
+    settings.DEBUG = False
+
+    seed(args.posts)
+    client = Client()
+
+    def clear():
+        caches['default'].clear()
+        caches['fragments'].clear()
+
+    rows = []
+    for label, url, cold in (
+        ('html index', '/', True),
+        ('html index, cache', '/', False),
+        ('html group', '/group/bench/', True),
+        ('api posts', '/api/v1/posts/', False),
+        ('api posts id,text', '/api/v1/posts/?fields=id,text', False),
+        ('api posts 100', '/api/v1/posts/?limit=100', False),
+        ('api group posts', '/api/v1/posts/?group=bench', False),
+    ):
+        rows.append((
+            label, throughput(client, url, args.seconds, clear if cold
+                              else None)
+        ))
+    report('Запросов в секунду, один процесс', rows, ('view', 'rps'))
+
+
+if __name__ == '__main__':
+    main()
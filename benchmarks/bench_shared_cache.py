@@ -0,0 +1,110 @@
+"""
+Истечение горячего ключа под нагрузкой нескольких процессов.
+
+Каждый процесс в цикле читает «главную страницу» с коротким
+TIMEOUT; построение страницы стоит --cost мс. Сравниваются:
+
+* locmem — у каждого процесса свой LocMemCache;
+* sqlite get/set — общий файл, но без защиты от давки;
+* sqlite single flight — get_or_recompute: страницу строит один
+  процесс, остальные ждут или отдают устаревшую копию.
+
+    python -m benchmarks.bench_shared_cache --workers 32
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, report
+
+MODES = ('locmem', 'sqlite get/set', 'sqlite single flight')
+
+
+def make_cache(mode, path):
+    if mode == 'locmem':
+        from django.core.cache.backends.locmem import LocMemCache
+        return LocMemCache('bench', {})
+    from yatube.cache import SQLiteCache
+    return SQLiteCache(path, {'OPTIONS': {'STALE_TIMEOUT': 5}})
+
+
+def worker(mode, path, args, started, results):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    import django
+    django.setup()
+    cache = make_cache(mode, path)
+    computed = 0
+
+    def compute():
+        nonlocal computed
+        computed += 1
+        time.sleep(args.cost / 1000)
+        return 'x' * 20000
+
+    started.wait()
+    deadline = time.perf_counter() + args.seconds
+    samples = []
+    while time.perf_counter() < deadline:
+        begin = time.perf_counter()
+        if mode == 'sqlite single flight':
+            cache.get_or_recompute('index', compute, timeout=args.ttl)
+        else:
+            page = cache.get('index')
+            if page is None:
+                cache.set('index', compute(), timeout=args.ttl)
+        samples.append((time.perf_counter() - begin) * 1000)
+    results.put((computed, samples))
+
+
+def run(mode, args):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'cache.sqlite3')
+        started = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=worker, args=(mode, path, args, started, results)
+            )
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(1)
+        started.set()
+        computed, samples = 0, []
+        for _ in processes:
+            count, latencies = results.get()
+            computed += count
+            samples.extend(latencies)
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return (
+        mode, computed, len(samples),
+        percentile(samples, 50), percentile(samples, 99),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--ttl', type=float, default=1)
+    parser.add_argument('--cost', type=float, default=100,
+                        help='Сколько мс строится страница')
+    args = parser.parse_args()
+    report(
+        f'{args.workers} процессов, {args.seconds} с, TIMEOUT {args.ttl} с, '
+        f'страница строится {args.cost} мс',
+        [run(mode, args) for mode in MODES],
+        ('mode', 'rebuilds', 'requests', 'p50 ms', 'p99 ms'),
+    )
+
+
+if __name__ == '__main__':
+    main()
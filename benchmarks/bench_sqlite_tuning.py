@@ -0,0 +1,152 @@
+"""
+Читатели и писатели одной файловой базы SQLite в разных процессах.
+
+Читатели в цикле строят ленту профиля случайного автора (страница
+feed_queryset), писатели публикуют записи через ORM со всеми
+сигналами. Каждая итерация — «запрос»: в начале и в конце
+вызывается close_old_connections(), как это делают обработчики
+request_started и request_finished. Сравниваются:
+
+* default — журнал отката и соединение на каждый запрос
+  (настройки Django по умолчанию);
+* tuned — SQLITE_PRAGMAS из настроек и CONN_MAX_AGE.
+
+    python -m benchmarks.bench_sqlite_tuning --readers 8 --writers 2
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, report
+
+MODES = ('default', 'tuned')
+
+
+def setup(mode, directory):
+    os.environ['YATUBE_DB'] = os.path.join(directory, 'db.sqlite3')
+    os.environ['YATUBE_CACHE_DIR'] = os.path.join(directory, 'cache')
+    os.environ['YATUBE_CONN_MAX_AGE'] = '0' if mode == 'default' else '600'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    settings.DEBUG = False
+    settings.THUMBNAIL_QUEUE = False
+    if mode == 'default':
+        # журнал отката, как у базы без настроек
+        settings.SQLITE_PRAGMAS = {'journal_mode': 'delete'}
+
+
+def prepare(mode, directory, authors, posts):
+    setup(mode, directory)
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from posts.models import Post
+
+    call_command('migrate', verbosity=0)
+    User = get_user_model()
+    User.objects.bulk_create(
+        User(username=f'author{i}') for i in range(authors)
+    )
+    users = list(User.objects.all())
+    Post.objects.bulk_create(
+        Post(text=f'post {i} ' * 20, author=users[i % len(users)])
+        for i in range(posts)
+    )
+
+
+def worker(role, mode, directory, args, started, results):
+    setup(mode, directory)
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, close_old_connections
+    from posts.feeds import feed_queryset
+    from posts.models import Post
+
+    users = list(get_user_model().objects.values_list('pk', flat=True))
+    close_old_connections()
+    started.wait()
+    samples, errors = [], 0
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        begin = time.perf_counter()
+        close_old_connections()
+        author_id = random.choice(users)
+        try:
+            if role == 'reader':
+                list(feed_queryset(
+                    Post.objects.filter(author_id=author_id)
+                ).order_by('-pub_date', '-id')[:10])
+            else:
+                Post.objects.create(text='written ' * 20,
+                                    author_id=author_id)
+        except OperationalError:
+            errors += 1
+        close_old_connections()
+        samples.append((time.perf_counter() - begin) * 1000)
+    results.put((role, samples, errors))
+
+
+def run(mode, args):
+    directory = tempfile.mkdtemp()
+    try:
+        process = multiprocessing.Process(
+            target=prepare, args=(mode, directory, args.authors, args.posts)
+        )
+        process.start()
+        process.join()
+        started = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        roles = ['reader'] * args.readers + ['writer'] * args.writers
+        processes = [
+            multiprocessing.Process(
+                target=worker,
+                args=(role, mode, directory, args, started, results)
+            )
+            for role in roles
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(2)
+        started.set()
+        samples = {'reader': [], 'writer': []}
+        errors = 0
+        for _ in processes:
+            role, latencies, failed = results.get()
+            samples[role].extend(latencies)
+            errors += failed
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    reads, writes = samples['reader'], samples['writer']
+    return (
+        mode,
+        len(reads) / args.seconds, percentile(reads, 99),
+        len(writes) / args.seconds, percentile(writes, 99),
+        errors,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--authors', type=int, default=100)
+    parser.add_argument('--posts', type=int, default=20000)
+    args = parser.parse_args()
+    report(
+        f'{args.readers} читателей, {args.writers} писателей, '
+        f'{args.seconds} с',
+        [run(mode, args) for mode in MODES],
+        ('mode', 'reads/s', 'read p99 ms', 'writes/s', 'write p99 ms',
+         'locked'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Задержка каждой страницы posts.urls на синтетических данных.
+
+База заполняется командой seed (степенное распределение авторов,
+подписок и комментариев), затем каждый URL из posts.urls
+запрашивается тестовым клиентом --repeat раз от имени самого
+активного автора. Для каждой страницы считаются p50/p95/p99,
+число SQL-запросов и пик выделенной за запрос памяти (tracemalloc),
+дважды: с прогретыми кэшами (warm) и со сброшенными перед каждым
+запросом (cold). Результат пишется в JSON, чтобы сравнивать
+коммиты между собой:
+
+    python -m benchmarks.bench_views --output before.json
+    python -m benchmarks.bench_views --output after.json \\
+        --compare before.json
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.common import percentile, report, setup_django
+
+# GET этих страниц меняет данные; page_not_found ждёт исключение
+# от обработчика handler404 и по своему URL не открывается
+SKIP = {'profile_follow', 'profile_unfollow', 'page_not_found'}
+MODES = ('warm', 'cold')
+QUERY = {'search': {'q': 'django cache'}}
+
+
+def sample():
+    """
+    Значения параметров URL: самый активный автор, его самая
+    обсуждаемая запись, её первый комментарий и крупнейшая группа.
+    """
+    from django.db.models import Count
+    from posts.models import Group, UserStats
+
+    stats = UserStats.objects.select_related('user').order_by(
+        '-posts_count'
+    ).first()
+    author = stats.user
+    group = Group.objects.annotate(
+        total=Count('group_posts')
+    ).order_by('-total').first()
+    post = author.author_posts.order_by('-comment_count').first()
+    return author, {
+        'username': author.username,
+        'post_id': post.pk,
+        'comment_id': post.comments.values_list('id', flat=True).first(),
+        'slug': group.slug,
+    }
+
+
+def targets(values):
+    from django.urls import reverse
+    from posts import urls
+
+    for pattern in urls.urlpatterns:
+        if pattern.name in SKIP:
+            continue
+        kwargs = {
+            name: values[name] for name in pattern.pattern.converters
+        }
+        yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+
+def clear_caches():
+    from django.core.cache import caches
+    from django.conf import settings
+
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def measure(client, url, query, repeat, cold):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, peaks, queries, status = [], [], [], None
+    for _ in range(repeat):
+        if cold:
+            clear_caches()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url, query)
+            timings.append((time.perf_counter() - started) * 1000)
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+        queries.append(len(captured))
+        status = response.status_code
+    return {
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': statistics.median(queries),
+        'peak_kib': round(statistics.median(peaks), 1),
+    }
+
+
+def compare(results, baseline):
+    rows = []
+    for name, view in results['views'].items():
+        for mode in MODES:
+            current = view[mode]
+            before = baseline['views'].get(name, {}).get(mode)
+            if not before:
+                continue
+            rows.append((
+                f'{name} {mode}',
+                current['p50_ms'] / max(before['p50_ms'], 1e-9),
+                current['p99_ms'] / max(before['p99_ms'], 1e-9),
+                current['queries'] - before['queries'],
+            ))
+    report('Отношение к базовому прогону', rows,
+           ('view', 'p50 x', 'p99 x', 'queries +'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--comments', type=int, default=30000)
+    parser.add_argument('--follows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--output', help='Файл для результатов JSON')
+    parser.add_argument('--compare', help='JSON прошлого прогона')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test import Client
+
+    # иначе на каждый ответ работает debug_toolbar
+    settings.DEBUG = False
+    scale = {
+        'users': args.users, 'posts': args.posts,
+        'comments': args.comments, 'follows': args.follows,
+    }
+    call_command('seed', verbosity=0, images=5, **scale)
+    author, values = sample()
+    client = Client()
+    client.force_login(author)
+
+    tracemalloc.start()
+    results = {'scale': scale, 'repeat': args.repeat, 'views': {}}
+    rows = []
+    for name, url in targets(values):
+        query = QUERY.get(name)
+        view = results['views'][name] = {'url': url}
+        for mode in MODES:
+            client.get(url, query)
+            view[mode] = measure(
+                client, url, query, args.repeat, mode == 'cold'
+            )
+            rows.append((
+                f'{name} {mode}', view[mode]['p50_ms'],
+                view[mode]['p95_ms'], view[mode]['p99_ms'],
+                view[mode]['queries'], view[mode]['peak_kib'],
+            ))
+    tracemalloc.stop()
+
+    report(f'Страницы posts.urls, {args.repeat} запросов', rows,
+           ('view', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KiB'))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
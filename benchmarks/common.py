@@ -0,0 +1,60 @@
+"""
+Общие помощники для скриптов замеров.
+
+Скрипты запускаются из корня проекта: python -m benchmarks.<имя>.
+Каждый поднимает Django с настройками yatube и работает
+в отдельной тестовой базе, рабочая db.sqlite3 не трогается.
+Кэши и MEDIA_ROOT, как в тестах, переносятся во временный каталог:
+сброс кэшей в замере не стирает кэш запущенного сервера, а
+картинки seed не попадают в media проекта.
+"""
+import atexit
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment
+    from yatube.test_runner import temporary_cache_settings
+    setup_test_environment()
+    directory = tempfile.mkdtemp(prefix='yatube-bench-')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    temporary_cache_settings(os.path.join(directory, 'cache')).enable()
+    override_settings(MEDIA_ROOT=os.path.join(directory, 'media')).enable()
+    connection.creation.create_test_db(verbosity=0, keepdb=False)
+
+
+def timeit(func, repeat=20):
+    """Медиана времени вызова func в миллисекундах."""
+    func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title, rows, columns):
+    print(title)
+    print('  '.join(f'{name:>14}' for name in columns))
+    for row in rows:
+        print('  '.join(
+            f'{value:>14.3f}' if isinstance(value, float) else f'{value:>14}'
+            for value in row
+        ))
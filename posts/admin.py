@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Group, Comment, Follow
+from . import search
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -8,6 +9,19 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # вместо LIKE '%...%' по всей таблице ищем в индексе FTS5
+        expression = search.match_expression(search_term)
+        if not expression or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        queryset = queryset.extra(
+            where=[search.posts_only_condition()],
+            params=[expression]
+        )
+        return queryset, False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from yatube import db, slowlog
+        from . import signals  # noqa: F401
+
+        # PRAGMA для SQLite на каждом новом соединении
+        connection_created.connect(db.configure)
+        # журнал медленных запросов, см. yatube/slowlog.py
+        connection_created.connect(slowlog.install)
@@ -0,0 +1,69 @@
+"""
+Массовое создание записей, комментариев и подписок.
+
+bulk_create не отправляет сигналы, поэтому производные данные
+(счётчики, ленты подписок, поисковый индекс, кэши) обновляются
+здесь сразу для всей пачки — то же, что signals.py делает для
+одного объекта. Функции вызываются внутри transaction.atomic().
+"""
+from . import counters, feeds, fragments, pagecache, search, timeline
+from .models import Comment, Follow, Post
+
+
+def _assign_pks(model, objects):
+    """
+    SQLite в Django 2.2 не возвращает id из bulk_create. Внутри
+    транзакции блокировка записи у нас, поэтому последние len(objects)
+    id таблицы — наши, в порядке вставки.
+    """
+    if not objects or objects[0].pk is not None:
+        return
+    pks = list(
+        model.objects.order_by('-pk').values_list('pk', flat=True)
+        [:len(objects)]
+    )
+    for obj, pk in zip(objects, reversed(pks)):
+        obj.pk = pk
+
+
+def create_posts(posts, batch_size=500):
+    posts = Post.objects.bulk_create(posts, batch_size=batch_size)
+    _assign_pks(Post, posts)
+    if search.available():
+        search.index_posts(posts)
+    timeline.fan_out(posts)
+    author_ids = [post.author_id for post in posts]
+    for author_id in set(author_ids):
+        feeds.refresh_author(author_id)
+    counters.posts_changed(author_ids)
+    pagecache.bump(
+        scope for post in posts for scope in pagecache.post_scopes(post)
+    )
+    return posts
+
+
+def create_comments(comments, batch_size=500):
+    comments = Comment.objects.bulk_create(comments, batch_size=batch_size)
+    _assign_pks(Comment, comments)
+    if search.available():
+        search.index_comments(comments)
+    post_ids = [comment.post_id for comment in comments]
+    counters.comments_changed(post_ids)
+    fragments.bump(set(post_ids))
+    pagecache.bump_posts(Post.objects.filter(pk__in=set(post_ids)))
+    return comments
+
+
+def create_follows(follows, batch_size=500):
+    follows = Follow.objects.bulk_create(follows, batch_size=batch_size)
+    for follow in follows:
+        timeline.backfill(follow.user_id, follow.author_id)
+    counters.follows_changed(
+        (follow.user_id, follow.author_id) for follow in follows
+    )
+    pagecache.bump(
+        pagecache.author_scope(user.username)
+        for follow in follows
+        for user in (follow.user, follow.author)
+    )
+    return follows
@@ -0,0 +1,153 @@
+"""
+Денормализованные счётчики: Post.comment_count и UserStats.
+
+Счётчики меняются атомарными UPDATE ... SET n = n + delta через F(),
+поэтому параллельные запросы не теряют изменений. Функции принимают
+сразу пачку изменений, чтобы массовые операции обходились одним
+запросом на строку счётчика. Расхождения исправляет команда recount.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def _apply(model, key, deltas, field):
+    for pk, delta in deltas.items():
+        if delta:
+            model.objects.filter(**{key: pk}).update(
+                **{field: F(field) + delta}
+            )
+
+
+def _bump_stats(field, deltas):
+    for user_id, delta in deltas.items():
+        if not delta:
+            continue
+        updated = UserStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta}
+        )
+        if not updated and delta > 0:
+            # строки ещё нет: считаем её целиком, изменение уже в базе.
+            # При уменьшении не создаём: так бывает, когда удаляется сам
+            # пользователь и каскад уже снёс его строку; если же её просто
+            # не было, stats_for посчитает её при первом показе
+            recount_users([user_id])
+
+
+def posts_changed(author_ids, sign=1):
+    _bump_stats(
+        'posts_count',
+        {pk: n * sign for pk, n in Counter(author_ids).items()}
+    )
+
+
+def comments_changed(post_ids, sign=1):
+    _apply(
+        Post, 'pk',
+        {pk: n * sign for pk, n in Counter(post_ids).items()},
+        'comment_count'
+    )
+
+
+def follows_changed(pairs, sign=1):
+    pairs = list(pairs)
+    _bump_stats(
+        'following_count',
+        {pk: n * sign for pk, n in Counter(u for u, _ in pairs).items()}
+    )
+    _bump_stats(
+        'followers_count',
+        {pk: n * sign for pk, n in Counter(a for _, a in pairs).items()}
+    )
+
+
+def stats_for(user):
+    """Счётчики профиля; отсутствующая строка создаётся пересчётом."""
+    try:
+        return UserStats.objects.get(user_id=user.pk)
+    except UserStats.DoesNotExist:
+        return recount_users([user.pk])[user.pk]
+
+
+def _grouped(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by()
+        .values(field).annotate(n=Count('pk')).values_list(field, 'n')
+    )
+
+
+def recount_users(user_ids):
+    """Пересчитывает UserStats для пачки пользователей, возвращает dict."""
+    posts = _grouped(Post.objects, 'author_id', user_ids)
+    followers = _grouped(Follow.objects, 'author_id', user_ids)
+    following = _grouped(Follow.objects, 'user_id', user_ids)
+    stats = {
+        user_id: UserStats(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    }
+    existing = set(UserStats.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', flat=True))
+    UserStats.objects.bulk_create(
+        [row for pk, row in stats.items() if pk not in existing],
+        ignore_conflicts=True
+    )
+    UserStats.objects.bulk_update(
+        [row for pk, row in stats.items() if pk in existing],
+        ['posts_count', 'followers_count', 'following_count']
+    )
+    return stats
+
+
+def recount_comments(post_ids):
+    """Исправляет Post.comment_count пачки записей, возвращает число правок."""
+    actual = _grouped(Comment.objects, 'post_id', post_ids)
+    drifted = []
+    for post in Post.objects.filter(pk__in=post_ids).only('comment_count'):
+        count = actual.get(post.pk, 0)
+        if post.comment_count != count:
+            post.comment_count = count
+            drifted.append(post)
+    Post.objects.bulk_update(drifted, ['comment_count'])
+    return len(drifted)
+
+
+def _id_batches(model, size):
+    last = 0
+    while True:
+        ids = list(
+            model.objects.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def recount(size=500):
+    """Пересчитывает все счётчики пачками, возвращает число правок."""
+    fixed = 0
+    for ids in _id_batches(Post, size):
+        fixed += recount_comments(ids)
+    for ids in _id_batches(User, size):
+        before = {
+            row.user_id: (row.posts_count, row.followers_count,
+                          row.following_count)
+            for row in UserStats.objects.filter(user_id__in=ids)
+        }
+        for pk, row in recount_users(ids).items():
+            after = (row.posts_count, row.followers_count,
+                     row.following_count)
+            fixed += before.get(pk) != after
+    return fixed
@@ -20,6 +20,15 @@ class PostForm(forms.ModelForm):
 
 
 class CommentForm(forms.ModelForm):
+    """
+    Комментарий или ответ: родитель передаётся аргументом parent,
+    а не полем формы — его выбирает представление по записи.
+    """
+    def __init__(self, *args, parent=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parent = parent
+        self.instance.parent = parent
+
     class Meta:
         model = Comment
         fields = ('text',)
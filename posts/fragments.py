@@ -0,0 +1,108 @@
+"""
+Кэш отрендеренных карточек записей (post_item.html).
+
+Ключ карточки состоит из id записи, Post.version и варианта
+зрителя: автор, вошедший пользователь или гость. Версия растёт
+при правке записи, новом или удалённом комментарии, когда готовы
+миниатюра или варианты картинки и при переименовании автора или
+группы, поэтому старые карточки просто
+перестают читаться и вытесняются по TIMEOUT. Лента получает
+карточки страницы одним get_many и рендерит только промахи.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from yatube import routers
+
+from .models import Post
+
+# увеличить при изменении разметки post_item.html
+CARD_VERSION = 1
+CARD_KEY = 'post_card:{}:{}:{}:{}:{}'
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def fragment_cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE', 'default')]
+
+
+def bump(post_ids):
+    """Делает устаревшими все закэшированные карточки записей."""
+    Post.objects.filter(pk__in=list(post_ids)).update(version=F('version') + 1)
+
+
+def bump_posts(posts):
+    """То же для QuerySet записей, например всех записей группы."""
+    posts.update(version=F('version') + 1)
+
+
+def viewer(user, post):
+    if not user.is_authenticated:
+        return 'guest'
+    return 'author' if user.pk == post.author_id else 'user'
+
+
+def card_key(post, user):
+    # время публикации защищает от повторно выданных id
+    # (например, после восстановления базы из копии)
+    return CARD_KEY.format(
+        CARD_VERSION, post.pk, int(post.pub_date.timestamp() * 1000000),
+        post.version, viewer(user, post)
+    )
+
+
+def _count(hits, misses):
+    with _lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+
+
+def stats():
+    """Попадания и промахи кэша карточек в этом процессе."""
+    with _lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    with _lock:
+        _stats.update(hits=0, misses=0)
+
+
+def attach(request, posts):
+    """
+    Кладёт в post.card готовый HTML карточки для каждой записи
+    страницы; шаблоны выводят {{ post.card }} вместо include.
+    """
+    posts = list(posts)
+    keys = {card_key(post, request.user): post for post in posts}
+    cache = fragment_cache()
+    cached = cache.get_many(keys)
+    missing = {}
+    template = get_template('post_item.html')
+    for key, post in keys.items():
+        html = cached.get(key)
+        if html is None:
+            html = template.render({'post': post, 'user': request.user})
+            missing[key] = html
+        post.card = mark_safe(html)
+    # карточки с реплики не кладём: общий кэш заполняет только default
+    if missing and routers.current_replica() is None:
+        cache.set_many(
+            missing,
+            timeout=getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 86400)
+        )
+    _count(len(keys) - len(missing), len(missing))
+    return posts
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import variants
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит адаптивные варианты картинок для уже загруженных записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить варианты и там, где они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            posts = posts.filter(image_variants='')
+        built = 0
+        for post_id, name in posts.values_list('pk', 'image').iterator():
+            built += variants.build(post_id, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Варианты построены для записей: {built}'
+        ))
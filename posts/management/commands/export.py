@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает записи или комментарии в NDJSON или CSV '
+            'с постоянным расходом памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['posts', 'comments'])
+        parser.add_argument(
+            '--format', choices=list(export.FORMATS), default='ndjson'
+        )
+        parser.add_argument('--author', help='Имя пользователя автора')
+        parser.add_argument('--group', help='slug группы')
+        parser.add_argument('--since', help='Не раньше даты (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Не позже даты (YYYY-MM-DD)')
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк читать из базы за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            lines = export.stream(
+                options['kind'], options['format'],
+                batch_size=options['batch_size'],
+                author=options['author'], group=options['group'],
+                since=options['since'], until=options['until'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        started = time.perf_counter()
+        total = 0
+        output = None
+        if options['output']:
+            output = open(options['output'], 'w', encoding='utf-8',
+                          newline='')
+        try:
+            for line in lines:
+                if output is None:
+                    self.stdout.write(line, ending='')
+                else:
+                    output.write(line)
+                total += 1
+        finally:
+            if output is not None:
+                output.close()
+        if options['format'] == 'csv':
+            total -= 1
+        elapsed = time.perf_counter() - started
+        # отчёт в stderr, чтобы не смешивать его с выгрузкой в stdout
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено строк: {total} за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,73 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import importer
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = ('Импортирует группы, пользователей, записи, комментарии и '
+            'подписки из NDJSON пачками bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', nargs='?', default='-',
+            help='Файл NDJSON, по умолчанию stdin'
+        )
+        parser.add_argument(
+            '--type', choices=importer.TYPES,
+            help='Тип строк без поля type, например для выгрузки export'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк одного типа писать за одну вставку'
+        )
+        parser.add_argument(
+            '--media-root',
+            help='Каталог, из которого копируются картинки записей'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько потоков копируют картинки'
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных авторов без пароля'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        job = importer.Importer(
+            batch_size=options['batch_size'],
+            media_root=options['media_root'],
+            workers=options['workers'],
+            create_users=options['create_users'],
+        )
+        if options['input'] == '-':
+            importer.read(sys.stdin, job, options['type'])
+        else:
+            with open(options['input'], encoding='utf-8') as stream:
+                importer.read(stream, job, options['type'])
+        loaded = time.perf_counter()
+        created = job.finish()
+        finished = time.perf_counter()
+
+        for line, reason in job.errors[:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f'строка {line}: {reason}')
+        if len(job.errors) > MAX_ERRORS_SHOWN:
+            self.stderr.write(
+                f'... и ещё {len(job.errors) - MAX_ERRORS_SHOWN}'
+            )
+        total = sum(created.values())
+        rate = total / max(loaded - started, 1e-9)
+        self.stdout.write(', '.join(
+            f'{kind}: {count}' for kind, count in created.items()
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано строк: {total} за {loaded - started:.1f} с '
+            f'({rate:.0f} строк/с), производные данные пересобраны '
+            f'за {finished - loaded:.1f} с, ошибок: {len(job.errors)}'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс записей и комментариев'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite')
+        total = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран: {total} строк'
+        ))
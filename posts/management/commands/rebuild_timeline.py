@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок (TimelineEntry)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Размер пачки вставки, по умолчанию TIMELINE_BATCH_SIZE'
+        )
+
+    def handle(self, *args, **options):
+        total = timeline.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Лента пересобрана: {total} записей'
+        ))
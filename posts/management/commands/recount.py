@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает хранимые счётчики комментариев, записей '
+            'и подписок и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк пересчитывать за один проход'
+        )
+
+    def handle(self, *args, **options):
+        fixed = counters.recount(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны, исправлено строк: {fixed}'
+        ))
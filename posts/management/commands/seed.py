@@ -0,0 +1,66 @@
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import importer, seed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, записями, '
+            'комментариями и подписками со степенным распределением')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=60000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Сколько разных картинок-источников сгенерировать'
+        )
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля записей с картинкой'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределены даты записей'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степени распределения активности'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        directory = tempfile.mkdtemp()
+        try:
+            images = seed.make_images(
+                directory, options['images'], random.Random(options['seed'])
+            )
+            job = importer.Importer(
+                batch_size=options['batch_size'], media_root=directory
+            )
+            for record in seed.records(
+                users=options['users'], groups=options['groups'],
+                posts=options['posts'], comments=options['comments'],
+                follows=options['follows'], images=images,
+                image_ratio=options['image_ratio'], days=options['days'],
+                alpha=options['alpha'], seed=options['seed'],
+            ):
+                job.add(record)
+            created = job.finish()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        for line, reason in job.errors[:10]:
+            self.stderr.write(f'{line}: {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{kind}: {count}' for kind, count in created.items())
+            + f' за {time.perf_counter() - started:.1f} с'
+        ))
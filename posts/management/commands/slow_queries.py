@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from yatube import slowlog
+
+
+class Command(BaseCommand):
+    help = ('Сводка журнала медленных SQL-запросов по fingerprint: '
+            'число, суммарное время и p95')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', help='Файл журнала, по умолчанию SLOW_QUERY_LOG'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько самых дорогих групп показать'
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Показать параметры и план самого медленного примера'
+        )
+
+    def handle(self, *args, **options):
+        path = options['log'] or slowlog.log_path()
+        try:
+            with open(path) as source:
+                groups = slowlog.aggregate(source)
+        except FileNotFoundError:
+            self.stdout.write(f'Журнал {path} пуст')
+            return
+        self.stdout.write(
+            f'{"count":>7} {"total ms":>12} {"p95 ms":>10}  fingerprint'
+        )
+        for group in groups[:options['limit']]:
+            self.stdout.write(
+                f'{group["count"]:>7} {group["total_ms"]:>12.1f} '
+                f'{group["p95_ms"]:>10.1f}  {group["fingerprint"]}'
+            )
+            self.stdout.write(f'        views: {", ".join(group["views"])}')
+            if options['plans']:
+                sample = group['sample']
+                self.stdout.write(f'        params: {sample["params"]}')
+                for step in sample['plan']:
+                    self.stdout.write(f'        plan: {step}')
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import pagecache
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик через backup '
+            'API; запускается периодически, см. yatube/routers.py')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Алиасы реплик, по умолчанию DATABASE_REPLICAS'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=1024,
+            help='Сколько страниц копировать за шаг; между шагами '
+                 'основная база доступна писателям'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не заданы: DATABASE_REPLICAS пуст')
+        primary = connections['default'].settings_dict
+        for alias in aliases:
+            replica = connections[alias].settings_dict
+            if 'sqlite3' not in replica['ENGINE']:
+                raise CommandError(f'{alias}: поддерживается только SQLite')
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target, pages=options['pages'])
+            finally:
+                target.close()
+                source.close()
+            # страницы, построенные по прошлой копии, устаревают
+            pagecache.bump([pagecache.replica_scope(alias)])
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: скопировано за '
+                f'{time.perf_counter() - started:.2f} с'
+            ))
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5("
+    "body, post_id UNINDEXED, comment_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE)
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, body, post_id, comment_id) '
+        'SELECT id * 2, text, id, NULL FROM posts_post'
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, body, post_id, comment_id) '
+        'SELECT id * 2 + 1, text, post_id, id FROM posts_comment'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+
+from . import variants
 
 
 User = get_user_model()
@@ -25,9 +28,31 @@ class Post(models.Model):
         blank=True, null=True,
         related_name='group_posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # счётчик поддерживается сигналами, см. posts/counters.py
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # JSON с адаптивными вариантами картинки, см. posts/variants.py
+    image_variants = models.TextField(blank=True, default='', editable=False)
+    # версия карточки в кэше фрагментов, см. posts/fragments.py
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            # ленты автора и группы: фильтр по FK и порядок ленты
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'
+            ),
+        ]
+
+    @cached_property
+    def picture(self):
+        return variants.picture(self.image_variants, self.image.name)
 
 
 class Comment(models.Model):
@@ -43,6 +68,36 @@ class Comment(models.Model):
     )
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    # ветки ответов, поля заполняют сигналы, см. posts/threads.py
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='replies'
+    )
+    # материализованный путь: id предков и свой через '/', у корневых
+    # комментариев пустой
+    path = models.CharField(
+        max_length=255, blank=True, default='', editable=False
+    )
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # все ответы ветки под комментарием, на любой глубине
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+            # корневые комментарии записи в порядке показа
+            models.Index(
+                fields=['post', 'parent', 'created', 'id'],
+                name='comment_post_root_idx'
+            ),
+            # поддерево — диапазон путей
+            models.Index(fields=['path'], name='comment_path_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -62,3 +117,51 @@ class Follow(models.Model):
            'user',
            'author',
         )
+        # (user, author) покрыт unique_together, списки подписчиков
+        # автора читаются с другой стороны
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Хранимые счётчики профиля вместо COUNT по связанным таблицам."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    # подписчики пользователя (Follow.author) и его подписки (Follow.user)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок, материализованная при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = (
+           'user',
+           'post',
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_feed_idx'
+            ),
+        ]
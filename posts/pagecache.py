@@ -0,0 +1,263 @@
+"""
+Кэш страниц лент с инвалидацией по поколениям.
+
+У каждой ленты есть счётчик поколения: общий (global), на группу
+(group:<slug>) и на автора (author:<username>). Сигналы записей,
+комментариев, подписок и групп увеличивают поколения затронутых
+лент, а ключ закэшированной страницы включает текущие поколения,
+поэтому после записи страница сразу строится заново, а TIMEOUT
+может быть долгим. Поколение — время последнего изменения ленты
+в микросекундах (не меньше прежнего значения + 1): после очистки
+кэша счётчик не повторит старые значения, а значит и старые ключи
+страниц, а Last-Modified показывает настоящее время изменения.
+"""
+import datetime
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from yatube import routers
+
+from .models import Post
+
+GENERATION_KEY = 'feed_gen:{}'
+PAGE_KEY = 'feed_page:{}:{}'
+
+
+def page_cache():
+    return caches[getattr(settings, 'PAGE_CACHE', 'default')]
+
+
+def _now():
+    return int(time.time() * 1000000)
+
+
+def generations(scopes):
+    """Текущие поколения лент, недостающие заводятся заново."""
+    cache = page_cache()
+    keys = {GENERATION_KEY.format(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    result = {keys[key]: value for key, value in found.items()}
+    for key, scope in keys.items():
+        if scope not in result:
+            cache.add(key, _now(), timeout=None)
+            result[scope] = cache.get(key)
+    return [result[scope] for scope in scopes]
+
+
+def bump(scopes):
+    """
+    Делает устаревшими страницы лент scopes. Внутри транзакции
+    поколение увеличивается ещё раз после коммита: до него читатель
+    мог закэшировать под новым поколением страницу без этой записи.
+    """
+    scopes = set(scopes)
+    _bump(scopes)
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    cache = page_cache()
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        if cache.add(key, _now(), timeout=None):
+            continue
+        previous = cache.get(key)
+        # гонка двух bump может оставить меньшее из двух времён, но оба
+        # новее прежнего поколения, а страницы строятся уже после записи
+        cache.set(
+            key, max((previous or 0) + 1, _now()), timeout=None
+        )
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def replica_scope(alias):
+    # растёт после каждой синхронизации реплики, см. sync_replica
+    return f'replica:{alias}'
+
+
+def post_scopes(post, old_group_slug=None):
+    """Ленты, в которых показывается запись."""
+    scopes = ['global', author_scope(post.author.username)]
+    if post.group_id is not None:
+        scopes.append(group_scope(post.group.slug))
+    if old_group_slug is not None:
+        scopes.append(group_scope(old_group_slug))
+    return scopes
+
+
+def bump_posts(posts):
+    """Делает устаревшими ленты, где показаны записи queryset posts."""
+    scopes = []
+    for post in posts.select_related('author', 'group'):
+        scopes.extend(post_scopes(post))
+    bump(scopes)
+
+
+def _viewer(request):
+    user = request.user
+    if not user.is_authenticated:
+        return 'guest'
+    return f'{user.pk}.{user.get_username()}'
+
+
+def page_key(request, generation):
+    raw = ':'.join([
+        request.method,
+        request.get_full_path(),
+        _viewer(request),
+        '.'.join(str(value) for value in generation),
+    ])
+    return PAGE_KEY.format(
+        request.resolver_match.url_name if request.resolver_match else '',
+        hashlib.md5(raw.encode()).hexdigest()
+    )
+
+
+def _state(request, state, kwargs):
+    # генерации нужны и валидаторам, и кэшу страницы: читаем их один раз
+    if not hasattr(request, '_feed_state'):
+        request._feed_state = state(request, **kwargs)
+    return request._feed_state
+
+
+def generation_state(scopes):
+    """
+    Состояние страницы ленты — поколения её лент. Состояние
+    страницы — пара (поколения, прочие значения) или None, если
+    страницы нет.
+    """
+    def state(request, **kwargs):
+        names = scopes(request, **kwargs)
+        replica = routers.current_replica()
+        if replica is not None:
+            # прочитанное с реплики устаревает с её синхронизацией,
+            # а не с поколением ленты
+            names = [*names, replica_scope(replica)]
+        return generations(names), ()
+    return state
+
+
+def post_state(request, username, post_id, **kwargs):
+    """
+    Состояние страницы записи и её фрагментов комментариев: версия
+    записи (правки и комментарии) и поколение ленты автора
+    (подписки, счётчики профиля).
+    """
+    try:
+        # get(), а не first(): без ORDER BY по единственной строке
+        version = Post.objects.values_list('version', flat=True).get(
+            pk=post_id, author__username=username
+        )
+    except Post.DoesNotExist:
+        return None
+    return generations([author_scope(username)]), (version,)
+
+
+def conditional(state):
+    """
+    ETag и Last-Modified без рендеринга страницы: ETag — хэш
+    адреса, зрителя и state(request, **kwargs), Last-Modified —
+    время самого свежего поколения. Совпавший запрос получает 304.
+
+    Дата HTTP точна до секунды, поэтому в первую секунду после
+    изменения Last-Modified не отдаётся: иначе следующее изменение
+    в ту же секунду клиент с If-Modified-Since не заметил бы.
+    Проверка по ETag работает всегда.
+    """
+    def etag(request, *args, **kwargs):
+        value = _state(request, state, kwargs)
+        if value is None:
+            return None
+        raw = ':'.join([
+            request.get_full_path(), _viewer(request),
+            '.'.join(str(item) for item in value[0] + list(value[1])),
+        ])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        value = _state(request, state, kwargs)
+        if value is None:
+            return None
+        # поколения — время изменения в микросекундах
+        changed = max(value[0])
+        if _now() - changed < 1000000:
+            return None
+        return datetime.datetime.fromtimestamp(
+            changed / 1000000, tz=timezone.utc
+        )
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # хранить можно, но перед показом надо сверить валидаторы
+            patch_cache_control(
+                response, no_cache=True,
+                private=request.user.is_authenticated
+            )
+            return response
+        return wrapped
+    return decorator
+
+
+def feed_page(scopes):
+    """Кэш страницы ленты по поколениям вместе с условным GET."""
+    def decorator(view):
+        return conditional(generation_state(scopes))(cache_feed(scopes)(view))
+    return decorator
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.cookies
+
+
+def cache_feed(scopes):
+    """
+    Декоратор страницы ленты: scopes(request, **kwargs) возвращает
+    список лент, от которых зависит страница. Кэшируются только
+    успешные ответы на GET и HEAD без cookie.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cache = page_cache()
+            key = page_key(
+                request, _state(request, generation_state(scopes), kwargs)[0]
+            )
+            timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 3600)
+            if hasattr(cache, 'get_or_recompute'):
+                # общий кэш: страницу строит один воркер, остальные ждут
+                return cache.get_or_recompute(
+                    key, lambda: view(request, *args, **kwargs),
+                    timeout=timeout, cacheable=_cacheable
+                )
+            response = cache.get(key)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if _cacheable(response):
+                cache.set(key, response, timeout=timeout)
+            return response
+        return wrapped
+    return decorator
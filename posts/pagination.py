@@ -0,0 +1,227 @@
+import base64
+import binascii
+import datetime
+import json
+import math
+
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 10
+# ключ сортировки лент: сначала новые записи, id разрешает совпадения дат
+FEED_KEYS = ('-pub_date', '-id')
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def _field(key):
+    return key.lstrip('-')
+
+
+def encode_cursor(values, direction=FORWARD):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    payload = [direction]
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            value = {'dt': value.isoformat()}
+        payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# целые за пределами INTEGER SQLite база не примет
+MAX_INT = 2 ** 63
+
+
+def key_kinds(model, keys):
+    """Типы значений курсора для полей ключа сортировки модели."""
+    kinds = []
+    for key in keys:
+        field = model._meta.get_field(_field(key))
+        if field.is_relation:
+            field = field.target_field
+        if isinstance(field, models.DateTimeField):
+            kinds.append(datetime.datetime)
+        elif isinstance(field, (models.AutoField, models.IntegerField)):
+            kinds.append(int)
+        elif isinstance(field, models.FloatField):
+            kinds.append(float)
+        else:
+            kinds.append(str)
+    return tuple(kinds)
+
+
+def _decode_value(value, kind):
+    """Значение нужного типа или None для подделанного."""
+    if kind is datetime.datetime:
+        if not isinstance(value, dict) or not isinstance(value.get('dt'), str):
+            return None
+        try:
+            return parse_datetime(value['dt'])
+        except (ValueError, TypeError):
+            return None
+    if isinstance(value, bool):
+        return None
+    if kind is int:
+        in_range = isinstance(value, int) and abs(value) < MAX_INT
+        return value if in_range else None
+    if kind is float:
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            return float(value)
+        return None
+    return value if isinstance(value, kind) else None
+
+
+def decode_cursor(token, kinds):
+    """
+    Возвращает (direction, values) или None для битого токена.
+    kinds — ожидаемые типы значений (см. key_kinds): подделанный
+    курсор с другими типами даёт первую страницу, а не ошибку базы.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if not isinstance(payload, list) or len(payload) != len(kinds) + 1:
+        return None
+    direction, values = payload[0], []
+    if direction not in (FORWARD, BACKWARD):
+        return None
+    for value, kind in zip(payload[1:], kinds):
+        value = _decode_value(value, kind)
+        if value is None:
+            return None
+        values.append(value)
+    return direction, values
+
+
+def keyset_filter(keys, values, forward=True):
+    """
+    Условие «строго после курсора» в порядке keys (или до него,
+    если forward=False). Отдельное нестрогое условие на первый ключ
+    позволяет базе начать чтение индекса сразу с нужного места,
+    а не отфильтровывать все предыдущие строки.
+    """
+    def lookup(key, strict=True):
+        descending = key.startswith('-')
+        op = 'lt' if descending == forward else 'gt'
+        return f'{_field(key)}__{op}' if strict else f'{_field(key)}__{op}e'
+
+    condition = Q()
+    for i, key in enumerate(keys):
+        step = Q(**{lookup(key): values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            step &= Q(**{_field(prev_key): prev_value})
+        condition |= step
+    return Q(**{lookup(keys[0], strict=False): values[0]}) & condition
+
+
+def _reverse(keys):
+    return [_field(key) if key.startswith('-') else f'-{key}' for key in keys]
+
+
+def _row_values(row, keys):
+    if isinstance(row, dict):
+        return [row[_field(key)] for key in keys]
+    return [getattr(row, _field(key)) for key in keys]
+
+
+def _query(request, cursor):
+    query = request.GET.copy()
+    query.pop('page', None)
+    query['cursor'] = cursor
+    return query.urlencode()
+
+
+def paginate(request, queryset, keys=FEED_KEYS, per_page=PAGE_SIZE,
+             transform=None):
+    """
+    Курсорная (keyset) постраничная навигация по queryset.
+
+    Страница выбирается условием по ключу сортировки из ?cursor=
+    вместо COUNT(*) и OFFSET, поэтому время ответа не зависит от
+    глубины. Старые ссылки ?page=N обслуживаются обычным Paginator.
+    В контекст, как и раньше, отдаются Paginator и Page; у страницы
+    дополнительно есть next_cursor/prev_cursor и готовые строки
+    запроса next_query/prev_query для ссылок.
+    """
+    queryset = queryset.order_by(*keys)
+    cursor = decode_cursor(
+        request.GET.get('cursor'), key_kinds(queryset.model, keys)
+    )
+    page_number = request.GET.get('page')
+
+    if cursor is None and page_number is not None:
+        legacy = Paginator(queryset, per_page).get_page(page_number)
+        rows = list(legacy.object_list)
+        has_prev, has_next = legacy.has_previous(), legacy.has_next()
+    elif cursor is None:
+        rows = list(queryset[:per_page + 1])
+        has_prev, has_next = False, len(rows) > per_page
+        rows = rows[:per_page]
+    elif cursor[0] == FORWARD:
+        rows = list(
+            queryset.filter(keyset_filter(keys, cursor[1]))[:per_page + 1]
+        )
+        has_prev, has_next = True, len(rows) > per_page
+        rows = rows[:per_page]
+    else:
+        rows = list(
+            queryset.filter(keyset_filter(keys, cursor[1], forward=False))
+            .order_by(*_reverse(keys))[:per_page + 1]
+        )
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+
+    return make_page(request, rows, keys, has_prev, has_next, transform)
+
+
+def make_page(request, rows, keys, has_prev, has_next, transform=None):
+    """
+    Собирает Paginator и Page из уже выбранных строк окна,
+    навешивая на страницу курсоры соседних страниц.
+    """
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(_row_values(rows[-1], keys), FORWARD)
+    if rows and has_prev:
+        prev_cursor = encode_cursor(_row_values(rows[0], keys), BACKWARD)
+
+    if transform is not None:
+        rows = transform(rows)
+    paginator = Paginator(rows, per_page=max(len(rows), 1))
+    page = paginator.page(1)
+    page.next_cursor = next_cursor
+    page.prev_cursor = prev_cursor
+    page.next_query = next_cursor and _query(request, next_cursor)
+    page.prev_query = prev_cursor and _query(request, prev_cursor)
+    return paginator, page
+
+
+def next_chunk(request, queryset, keys, per_page=PAGE_SIZE):
+    """
+    Порция для догрузки «ещё»: строки после курсора из ?cursor=
+    в порядке keys. Возвращает уже выполненный QuerySet порции и
+    строку запроса следующей порции (None, если строк больше нет).
+    Наличие следующей порции проверяет EXISTS по тому же индексу.
+    """
+    queryset = queryset.order_by(*keys)
+    cursor = decode_cursor(
+        request.GET.get('cursor'), key_kinds(queryset.model, keys)
+    )
+    if cursor is not None and cursor[0] == FORWARD:
+        queryset = queryset.filter(keyset_filter(keys, cursor[1]))
+    chunk = queryset[:per_page]
+    rows = list(chunk)
+    if len(rows) < per_page:
+        return chunk, None
+    last = _row_values(rows[-1], keys)
+    if not queryset.filter(keyset_filter(keys, last)).exists():
+        return chunk, None
+    return chunk, _query(request, encode_cursor(last, FORWARD))
@@ -0,0 +1,170 @@
+"""
+Полнотекстовый поиск по записям и комментариям на SQLite FTS5.
+
+Виртуальная таблица posts_search зеркалирует Post.text и
+Comment.text. Чтобы обновлять строку индекса без поиска по
+неиндексируемым колонкам, rowid вычисляется из первичного ключа:
+запись — 2 * id, комментарий — 2 * id + 1. Индекс обновляется
+сигналами, полностью пересобирается командой rebuild_search.
+Результаты ранжируются bm25 (колонка rank: саму функцию bm25()
+нельзя звать внутри агрегата), совпавший комментарий поднимает
+свою запись.
+"""
+from django.db import connection
+
+from .feeds import feed_queryset
+from .models import Comment, Post
+from .pagination import (
+    BACKWARD, FORWARD, PAGE_SIZE, decode_cursor, make_page, paginate
+)
+
+TABLE = 'posts_search'
+SEARCH_KEYS = ('score', 'post_id')
+# типы значений курсора поиска: score — ранг FTS5
+SEARCH_KINDS = (float, int)
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def _post_rowid(post_id):
+    return post_id * 2
+
+
+def _comment_rowid(comment_id):
+    return comment_id * 2 + 1
+
+
+def match_expression(query):
+    """
+    Превращает пользовательский ввод в выражение MATCH: каждое слово
+    берётся в кавычки, чтобы операторы FTS5 не ломали запрос.
+    """
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def _replace(rows):
+    """rows: (rowid, body, post_id, comment_id)."""
+    rows = list(rows)
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [(row[0],) for row in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, body, post_id, comment_id) '
+            f'VALUES (%s, %s, %s, %s)',
+            rows
+        )
+
+
+def index_posts(posts):
+    _replace(
+        (_post_rowid(post.pk), post.text, post.pk, None) for post in posts
+    )
+
+
+def index_comments(comments):
+    _replace(
+        (_comment_rowid(comment.pk), comment.text, comment.post_id,
+         comment.pk)
+        for comment in comments
+    )
+
+
+def _delete(rowids):
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [(rowid,) for rowid in rowids]
+        )
+
+
+def remove_posts(post_ids):
+    _delete(_post_rowid(pk) for pk in post_ids)
+
+
+def remove_comments(comment_ids):
+    _delete(_comment_rowid(pk) for pk in comment_ids)
+
+
+def rebuild():
+    """Пересобирает индекс из таблиц записей и комментариев."""
+    posts, comments = Post._meta.db_table, Comment._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, body, post_id, comment_id) '
+            f'SELECT id * 2, text, id, NULL FROM {posts}'
+        )
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, body, post_id, comment_id) '
+            f'SELECT id * 2 + 1, text, post_id, id FROM {comments}'
+        )
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def posts_only_condition():
+    """WHERE для queryset записей, текст которых совпал с запросом."""
+    return (
+        f'{Post._meta.db_table}.id IN (SELECT post_id FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND comment_id IS NULL)'
+    )
+
+
+def _ranked(expression, cursor, limit):
+    forward = cursor is None or cursor[0] == FORWARD
+    having, params = '', [expression]
+    if cursor is not None:
+        op = '>' if forward else '<'
+        score, post_id = cursor[1]
+        having = (
+            f'HAVING score {op} %s OR (score = %s AND post_id {op} %s)'
+        )
+        params += [score, score, post_id]
+    order = 'score, post_id' if forward else 'score DESC, post_id DESC'
+    with connection.cursor() as db:
+        db.execute(
+            f'SELECT post_id, MIN(rank) AS score FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s GROUP BY post_id {having} '
+            f'ORDER BY {order} LIMIT %s',
+            params + [limit]
+        )
+        return [
+            {'post_id': post_id, 'score': score}
+            for post_id, score in db.fetchall()
+        ]
+
+
+def search_page(request, query, per_page=PAGE_SIZE):
+    """
+    Страница результатов поиска с той же курсорной навигацией,
+    что и у лент: ключ (score, post_id) вместо (pub_date, id).
+    """
+    if not available():
+        return paginate(
+            request, feed_queryset(Post.objects.filter(text__icontains=query))
+        )
+    expression = match_expression(query)
+    cursor = decode_cursor(request.GET.get('cursor'), SEARCH_KINDS)
+    rows = _ranked(expression, cursor, per_page + 1) if expression else []
+    full = len(rows) > per_page
+    rows = rows[:per_page]
+    if cursor is not None and cursor[0] == BACKWARD:
+        rows.reverse()
+        has_prev, has_next = full, True
+    else:
+        has_prev, has_next = cursor is not None, full
+
+    def hydrate(rows):
+        ids = [row['post_id'] for row in rows]
+        posts = feed_queryset().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+    return make_page(request, rows, SEARCH_KEYS, has_prev, has_next, hydrate)
@@ -0,0 +1,113 @@
+"""
+Синтетические данные для замеров: пользователи, группы, записи,
+комментарии, подписки и картинки со степенным распределением.
+
+Активность на настоящем сайте неравномерна: немногие авторы пишут
+большую часть записей и собирают большую часть подписчиков, а
+комментарии копятся под популярными записями. Поэтому автор записи,
+автор подписки, группа и запись комментария выбираются с весом
+1 / rank ** alpha (распределение Ципфа), а не равномерно.
+
+Строки отдаются генератором в формате importer.py и пишутся тем же
+Importer, что и import_posts: пачками bulk_create с одной
+пересборкой счётчиков, лент и поиска в конце.
+"""
+import datetime
+import itertools
+import os
+import random
+
+from django.utils import timezone
+from PIL import Image
+
+WORDS = (
+    'django python sqlite index cache feed query page post comment '
+    'author group follow image thumbnail search profile timeline '
+    'latency memory worker request response template signal counter '
+    'replica migration benchmark cursor keyset batch stream export'
+).split()
+
+
+def cumulative_weights(size, alpha):
+    """Накопленные веса Ципфа для random.choices(cum_weights=...)."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** alpha for rank in range(size)
+    ))
+
+
+def text(rng, low=5, high=60):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def make_images(directory, count, rng):
+    """Картинки-источники разных цветов и пропорций в directory."""
+    names = []
+    for i in range(count):
+        width = rng.choice((640, 960, 1280, 1920))
+        height = int(width * rng.choice((0.35, 0.5, 0.75, 1)))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        name = f'seed-{i}.jpg'
+        Image.new('RGB', (width, height), color).save(
+            os.path.join(directory, name), 'JPEG', quality=70
+        )
+        names.append(name)
+    return names
+
+
+def records(users=100, groups=10, posts=1000, comments=3000,
+            follows=2000, images=(), image_ratio=0.1, days=365,
+            alpha=1.1, seed=0):
+    """Строки для Importer: сначала справочники, затем связи."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    usernames = [f'user{i}' for i in range(users)]
+    slugs = [f'group-{i}' for i in range(groups)]
+
+    for username in usernames:
+        yield {'type': 'user', 'username': username}
+    for slug in slugs:
+        yield {'type': 'group', 'slug': slug, 'title': slug.title(),
+               'description': text(rng, 3, 12)}
+
+    user_weights = cumulative_weights(users, alpha)
+    group_weights = cumulative_weights(groups, alpha)
+    dates = []
+    for i in range(posts):
+        pub_date = now - datetime.timedelta(seconds=rng.uniform(
+            0, days * 24 * 3600
+        ))
+        dates.append(pub_date)
+        group = None
+        if slugs and rng.random() < 0.7:
+            group = rng.choices(slugs, cum_weights=group_weights)[0]
+        image = None
+        if images and rng.random() < image_ratio:
+            image = rng.choice(images)
+        yield {
+            'type': 'post', 'id': i,
+            'author': rng.choices(usernames, cum_weights=user_weights)[0],
+            'group': group, 'text': text(rng), 'image': image,
+            'pub_date': pub_date.isoformat(),
+        }
+
+    post_weights = cumulative_weights(posts, alpha)
+    # популярные записи — случайные, а не самые старые
+    ranked = rng.sample(range(posts), posts)
+    for _ in range(comments if posts else 0):
+        post_id = rng.choices(ranked, cum_weights=post_weights)[0]
+        created = dates[post_id] + datetime.timedelta(
+            seconds=rng.uniform(0, 3 * 24 * 3600)
+        )
+        yield {
+            'type': 'comment', 'post': post_id,
+            'author': rng.choices(usernames, cum_weights=user_weights)[0],
+            'text': text(rng, 2, 30), 'created': min(created, now).isoformat(),
+        }
+
+    seen = set()
+    for _ in range(follows):
+        user = rng.choice(usernames)
+        author = rng.choices(usernames, cum_weights=user_weights)[0]
+        if user != author and (user, author) not in seen:
+            seen.add((user, author))
+            yield {'type': 'follow', 'user': user, 'author': author}
@@ -0,0 +1,165 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (
+    counters, feeds, fragments, pagecache, search, threads, timeline
+)
+from .models import Comment, Follow, Group, Post, User
+
+
+def _comment_scopes(comment):
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=comment.post_id
+    ).first()
+    return pagecache.post_scopes(post) if post is not None else ['global']
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # при смене группы устаревает и лента прежней группы
+    instance._old_group_slug = None
+    if instance.pk is not None and not raw:
+        instance._old_group_slug = Post.objects.filter(
+            pk=instance.pk, group__isnull=False
+        ).exclude(group_id=instance.group_id).values_list(
+            'group__slug', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if search.available():
+        search.index_posts([instance])
+    if created and not raw:
+        timeline.fan_out([instance])
+        feeds.refresh_author(instance.author_id)
+        counters.posts_changed([instance.author_id])
+    elif not raw:
+        fragments.bump([instance.pk])
+        instance.refresh_from_db(fields=['version'])
+    pagecache.bump(pagecache.post_scopes(
+        instance, getattr(instance, '_old_group_slug', None)
+    ))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if search.available():
+        search.remove_posts([instance.pk])
+    feeds.refresh_author(instance.author_id)
+    counters.posts_changed([instance.author_id], sign=-1)
+    pagecache.bump(pagecache.post_scopes(instance))
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is None and instance.parent_id and not raw:
+        threads.place(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if search.available():
+        search.index_comments([instance])
+    if created and not raw:
+        if instance.parent_id:
+            threads.attach(instance)
+        counters.comments_changed([instance.post_id])
+        fragments.bump([instance.post_id])
+        pagecache.bump(_comment_scopes(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if search.available():
+        search.remove_comments([instance.pk])
+    threads.detach(instance)
+    counters.comments_changed([instance.post_id], sign=-1)
+    fragments.bump([instance.post_id])
+    pagecache.bump(_comment_scopes(instance))
+
+
+def _follow_scopes(follow):
+    # счётчики подписок видны в профилях обоих пользователей
+    return [
+        pagecache.author_scope(follow.author.username),
+        pagecache.author_scope(follow.user.username),
+    ]
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+        counters.follows_changed([(instance.user_id, instance.author_id)])
+        pagecache.bump(_follow_scopes(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    counters.follows_changed(
+        [(instance.user_id, instance.author_id)], sign=-1
+    )
+    pagecache.bump(_follow_scopes(instance))
+
+
+def _renamed(posts, scopes):
+    """
+    Имя автора и группа видны в карточках записей posts: карточки
+    и страницы лент с этими записями устаревают.
+    """
+    fragments.bump_posts(posts)
+    scopes = ['global', *scopes]
+    scopes.extend(map(pagecache.author_scope, posts.values_list(
+        'author__username', flat=True
+    ).distinct()))
+    scopes.extend(map(pagecache.group_scope, posts.filter(
+        group__isnull=False
+    ).values_list('group__slug', flat=True).distinct()))
+    pagecache.bump(scopes)
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, raw=False, **kwargs):
+    instance._old_slug = None
+    if instance.pk is not None and not raw:
+        instance._old_slug = Group.objects.filter(pk=instance.pk).exclude(
+            slug=instance.slug, title=instance.title
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    scopes = [pagecache.group_scope(instance.slug)]
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug is None:
+        pagecache.bump(scopes)
+    else:
+        _renamed(
+            Post.objects.filter(group=instance),
+            [*scopes, pagecache.group_scope(old_slug)]
+        )
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # карточки устаревают только при смене имени; вход сохраняет
+    # один last_login и лишнего запроса не делает
+    instance._old_username = None
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if instance.pk is not None and not raw:
+        instance._old_username = User.objects.filter(pk=instance.pk).exclude(
+            username=instance.username
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    old_username = getattr(instance, '_old_username', None)
+    if old_username is not None:
+        _renamed(
+            Post.objects.filter(author=instance),
+            [pagecache.author_scope(old_username)]
+        )
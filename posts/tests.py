@@ -1,8 +1,34 @@
-from time import sleep
-from django.test import Client, TestCase
+import base64
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
 from django.urls import reverse
-from django.core.cache import cache
-from .models import User, Post, Group
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from yatube import db, metrics, profiler, routers, slowlog
+from yatube.cache import SQLiteCache
+from . import feeds, fragments, pagecache, threads, thumbnails, variants
+from .feeds import RECENT_KEY, author_recent, recent_cache
+from .models import (
+    User, Post, Group, Comment, Follow, TimelineEntry, UserStats
+)
+from .pagination import encode_cursor
 
 
 class ProfileTest(TestCase):
@@ -308,47 +334,39 @@ class ProfileTest(TestCase):
 
     def test_kache_new_posts(self):
         """
-        Проверка видимости нового поста на главной странце
-        до и после чистки кэша
+        Новый пост виден на главной странице сразу,
+        без чистки кэша
         """
+        url = reverse('index')
+        self.client.get(url)
         self.client.force_login(self.user)
-        url = reverse('new_post')
+        self.client.get(url)
         new_post = 'JCu9K^W1sM75dM9*@'
-        response = self.client.post(
-            url,
+        self.client.post(
+            reverse('new_post'),
             data={'text': new_post},
             follow=True
         )
-        # не видно на главной странице
-        url = reverse('index')
         response = self.client.get(url)
-        self.assertNotContains(response, new_post)
-        # почистим кэш и новый текст станет виден на главной странице
-        cache.clear()
+        self.assertContains(response, new_post)
+        self.client.logout()
         response = self.client.get(url)
         self.assertContains(response, new_post)
 
     def test_kache_time(self):
         """
-        Проверка видимости нового поста на главной странце
-        до и после прохождения времени кэширования
+        Повторный запрос главной страницы отдаётся из кэша
+        без запросов к базе, пока ничего не записано
         """
-        self.client.force_login(self.user)
-        url = reverse('new_post')
-        new_post = 'DR#4x@X97$7^kFr!l'
-        response = self.client.post(
-            url,
-            data={'text': new_post},
-            follow=True
-        )
-        # не видно на главной странице
         url = reverse('index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # изменение в обход сигналов кэш не сбрасывает
+        Post.objects.update(text='DR#4x@X97$7^kFr!l')
         response = self.client.get(url)
-        self.assertNotContains(response, new_post)
-        # дадим время и новый текст станет виден на главной странице
-        sleep(20)
-        response = self.client.get(url)
-        self.assertContains(response, new_post)
+        self.assertNotContains(response, 'DR#4x@X97$7^kFr!l')
 
     def test_comments_one(self):
         """
@@ -409,3 +427,1757 @@ class ProfileTest(TestCase):
         )
         response = self.client.get(url)
         self.assertNotContains(response, new_comment_logout)
+
+
+class CursorPaginatorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='pager',
+            password='s12crac##kle345'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'post {i}', author=self.user) for i in range(25)
+        )
+        self.ids = list(
+            Post.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+        cache.clear()
+
+    def page_ids(self, response):
+        return [post.id for post in response.context['page']]
+
+    def test_walk_forward_and_back(self):
+        """
+        Проход по ленте курсорами вперёд и назад
+        без пропусков и повторов
+        """
+        url = reverse(
+            'profile_view',
+            kwargs={'username': self.user.username}
+        )
+        response = self.client.get(url)
+        pages = [self.page_ids(response)]
+        seen = list(pages[0])
+        while response.context['page'].next_query:
+            response = self.client.get(
+                f"{url}?{response.context['page'].next_query}"
+            )
+            pages.append(self.page_ids(response))
+            seen += pages[-1]
+        self.assertEqual(seen, self.ids)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        response = self.client.get(
+            f"{url}?{response.context['page'].prev_query}"
+        )
+        self.assertEqual(self.page_ids(response), pages[1])
+        response = self.client.get(
+            f"{url}?{response.context['page'].prev_query}"
+        )
+        self.assertEqual(self.page_ids(response), pages[0])
+        self.assertIsNone(response.context['page'].prev_cursor)
+
+    def test_legacy_page_number(self):
+        """
+        Старые ссылки ?page=N продолжают работать
+        """
+        response = self.client.get(reverse('index'), {'page': 2})
+        self.assertEqual(self.page_ids(response), self.ids[10:20])
+        self.assertIsNotNone(response.context['page'].prev_cursor)
+        self.assertIsNotNone(response.context['page'].next_cursor)
+
+    def test_broken_cursor(self):
+        """
+        Испорченный курсор отдаёт первую страницу, а не ошибку
+        """
+        response = self.client.get(reverse('index'), {'cursor': '%%%'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.page_ids(response), self.ids[:10])
+
+    def test_tampered_cursor(self):
+        """
+        Подделанный, но корректный JSON курсора не роняет страницы
+        """
+        def token(*values):
+            raw = json.dumps(['n', *values]).encode()
+            return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+        moment = {'dt': '2020-01-01T00:00:00+00:00'}
+        tokens = [
+            token(moment, 'abc'),
+            token(moment, [1]),
+            token({'dt': '2020-13-45T25:61:00'}, 1),
+            token({'dt': 5}, 1),
+            token(moment, 2 ** 70),
+            token(moment, True),
+            token([1], 1),
+            token('abc'),
+            token(1.5, 'x'),
+        ]
+        post = Post.objects.first()
+        root = Comment.objects.create(post=post, author=self.user, text='root')
+        urls = [
+            (reverse('index'), {}),
+            (reverse('profile_view', args=['pager']), {}),
+            (reverse('search'), {'q': 'post'}),
+            (reverse('post_comments', args=['pager', post.id]), {}),
+            (reverse('comment_thread', args=['pager', post.id, root.id]), {}),
+            (reverse('api:post_list'), {}),
+            (reverse('api:group_list'), {}),
+            (reverse('api:comment_list', args=[post.id]), {}),
+        ]
+        for url, query in urls:
+            for cursor in tokens:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(
+                        url, {**query, 'cursor': cursor}
+                    )
+                    self.assertIn(response.status_code, (200, 404))
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='reader',
+            password='s12crac##kle345'
+        )
+        self.author = User.objects.create_user(
+            username='writer',
+            password='s12crac##kle3452'
+        )
+        self.old_post = Post.objects.create(
+            text='Written before the follow',
+            author=self.author
+        )
+        self.client.force_login(self.reader)
+
+    def feed_texts(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_follow_fan_out_and_unfollow(self):
+        """
+        Подписка дописывает старые записи автора в ленту,
+        новые записи раскладываются при публикации,
+        отписка убирает их из ленты
+        """
+        self.client.get(
+            reverse('profile_follow', kwargs={'username': 'writer'})
+        )
+        self.assertEqual(self.feed_texts(), [self.old_post.text])
+        Post.objects.create(
+            text='Written after the follow',
+            author=self.author
+        )
+        self.assertEqual(
+            self.feed_texts(),
+            ['Written after the follow', self.old_post.text]
+        )
+        self.client.get(
+            reverse('profile_unfollow', kwargs={'username': 'writer'})
+        )
+        self.assertEqual(self.feed_texts(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_rebuild_timeline(self):
+        """
+        Команда rebuild_timeline восстанавливает ленту по подпискам
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timeline', stdout=StringIO())
+        self.assertEqual(self.feed_texts(), [self.old_post.text])
+
+
+@override_settings(FEED_ENGINE='merge', FEED_RECENT_POSTS=4)
+class MergeFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        recent_cache().clear()
+        self.client = Client()
+        self.reader = User.objects.create_user(
+            username='reader',
+            password='s12crac##kle345'
+        )
+        for number in range(3):
+            author = User.objects.create_user(username=f'author{number}')
+            Follow.objects.create(user=self.reader, author=author)
+            for i in range(3 + number * 4):
+                Post.objects.create(text=f'{number}-{i}', author=author)
+        self.client.force_login(self.reader)
+
+    def walk(self):
+        texts = []
+        response = self.client.get(reverse('follow_index'))
+        texts += [post.text for post in response.context['page']]
+        while response.context['page'].next_query:
+            response = self.client.get(
+                f"{reverse('follow_index')}"
+                f"?{response.context['page'].next_query}"
+            )
+            texts += [post.text for post in response.context['page']]
+        return texts
+
+    def test_merge_matches_query(self):
+        """
+        Лента, собранная слиянием кэшей авторов, совпадает
+        с лентой из базы, в том числе за пределами кэша
+        """
+        merged = self.walk()
+        with self.settings(FEED_ENGINE='query'):
+            self.assertEqual(merged, self.walk())
+        self.assertEqual(len(merged), 3 + 7 + 11)
+
+    def test_cache_refresh(self):
+        """
+        Новая и удалённая запись сразу отражаются в кэше автора
+        """
+        self.walk()
+        author = User.objects.get(username='author0')
+        post = Post.objects.create(text='fresh', author=author)
+        self.assertEqual(self.walk()[0], 'fresh')
+        post.delete()
+        self.assertNotIn('fresh', self.walk())
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Число запросов на страницу ленты не зависит от числа записей
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='budget')
+        self.reader = User.objects.create_user(username='budget_reader')
+        self.group = Group.objects.create(
+            title='Budget group',
+            slug='budget',
+            description='Budget group description'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(12):
+            post = Post.objects.create(
+                text=f'post {i}',
+                author=self.author,
+                group=self.group
+            )
+            for j in range(2):
+                Comment.objects.create(
+                    post=post,
+                    author=self.reader,
+                    text=f'comment {j}'
+                )
+
+    def test_index(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('index'))
+
+    def test_group_posts(self):
+        with self.assertNumQueries(2):
+            self.client.get(
+                reverse('group_posts', kwargs={'slug': self.group.slug})
+            )
+
+    def test_profile_view(self):
+        with self.assertNumQueries(3):
+            self.client.get(
+                reverse('profile_view', kwargs={'username': 'budget'})
+            )
+
+    def test_follow_index(self):
+        self.client.force_login(self.reader)
+        for engine in ('timeline', 'merge', 'query'):
+            with self.settings(FEED_ENGINE=engine):
+                recent_cache().clear()
+                self.client.get(reverse('follow_index'))
+                with self.assertNumQueries(4 if engine != 'query' else 3):
+                    response = self.client.get(reverse('follow_index'))
+                self.assertContains(response, 'Количество комментариев 2')
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='counted')
+        self.reader = User.objects.create_user(username='counting')
+        self.post = Post.objects.create(text='Counted', author=self.author)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """
+        Счётчики меняются при создании и удалении записей,
+        комментариев и подписок
+        """
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='First'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """
+        Команда recount исправляет разошедшиеся счётчики
+        """
+        Comment.objects.create(post=self.post, author=self.reader, text='1')
+        Post.objects.update(comment_count=7)
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.assertIn('3', out.getvalue())
+
+    def test_delete_user(self):
+        """
+        Удаление пользователя с записями, комментариями и подписками
+        не воссоздаёт его счётчики
+        """
+        Comment.objects.create(post=self.post, author=self.author, text='1')
+        Comment.objects.create(post=self.post, author=self.reader, text='2')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.author.delete()
+        self.assertFalse(UserStats.objects.filter(
+            user_id=self.author.pk
+        ).exists())
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        stats = self.stats(self.reader)
+        self.assertEqual(
+            (stats.followers_count, stats.following_count), (0, 0)
+        )
+
+    def test_edit_keeps_concurrent_counters(self):
+        """
+        Правка записи не затирает счётчик, версию и варианты картинки,
+        изменённые другим запросом во время правки
+        """
+        from .forms import PostForm
+        is_valid = PostForm.is_valid
+
+        def concurrent(form):
+            # запись уже загружена представлением
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='1'
+            )
+            Post.objects.filter(pk=self.post.pk).update(image_variants='{}')
+            return is_valid(form)
+
+        self.client.force_login(self.author)
+        version = Post.objects.get(pk=self.post.pk).version
+        with mock.patch.object(PostForm, 'is_valid', concurrent):
+            self.client.post(
+                reverse('post_edit', args=['counted', self.post.pk]),
+                {'text': 'Edited'}
+            )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Edited')
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.post.image_variants, '{}')
+        # комментарий и правка подняли версию по разу
+        self.assertEqual(self.post.version, version + 2)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='finder',
+            password='s12crac##kle345'
+        )
+        self.post = Post.objects.create(
+            text='Django is a high-level Python Web framework',
+            author=self.user
+        )
+        self.other = Post.objects.create(
+            text='Совсем другая запись',
+            author=self.user
+        )
+
+    def found(self, query, **params):
+        response = self.client.get(reverse('search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response, [post.id for post in response.context['page']]
+
+    def test_search_posts_and_comments(self):
+        """
+        Поиск находит запись по её тексту и по тексту комментария,
+        правка и удаление сразу отражаются в индексе
+        """
+        self.assertEqual(self.found('python')[1], [self.post.id])
+        self.assertEqual(self.found('ЗАПИСЬ')[1], [self.other.id])
+        comment = Comment.objects.create(
+            post=self.other, author=self.user, text='про python тоже'
+        )
+        self.assertCountEqual(
+            self.found('python')[1], [self.post.id, self.other.id]
+        )
+        comment.delete()
+        self.post.text = 'Flask'
+        self.post.save()
+        self.assertEqual(self.found('python')[1], [])
+        self.other.delete()
+        self.assertEqual(self.found('запись')[1], [])
+
+    def test_search_syntax_is_escaped(self):
+        """
+        Операторы FTS5 во вводе не приводят к ошибке
+        """
+        self.assertEqual(self.found('"python AND (OR*')[1], [])
+        self.assertEqual(self.found('')[1], [])
+
+    def test_search_pagination(self):
+        """
+        Результаты листаются курсором без повторов
+        """
+        Post.objects.bulk_create(
+            Post(text=f'python {i}', author=self.user) for i in range(15)
+        )
+        call_command('rebuild_search', stdout=StringIO())
+        response, first = self.found('python')
+        page = response.context['page']
+        response, second = self.found(
+            'python', cursor=page.next_cursor
+        )
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 6)
+        self.assertFalse(set(first) & set(second))
+        self.assertIn('q=python', page.next_query)
+
+    def test_admin_search(self):
+        """
+        Поиск в админке идёт по полнотекстовому индексу
+        """
+        admin = User.objects.create_superuser(
+            'boss', 'boss@example.com', 's12crac##kle345'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'framework'}
+        )
+        self.assertEqual(
+            [post.id for post in response.context['cl'].result_list],
+            [self.post.id]
+        )
+
+
+class ThumbnailQueueTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='painter',
+            password='s12crac##kle345'
+        )
+        self.client.force_login(self.user)
+
+    def upload(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(buffer, 'JPEG')
+        image = SimpleUploadedFile(
+            'red.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+        self.client.post(
+            reverse('new_post'),
+            data={'text': 'With picture', 'image': image}
+        )
+
+    def test_thumbnail_rendered_out_of_band(self):
+        """
+        Лента не строит миниатюру в запросе, а ставит её в очередь
+        и до готовности показывает заглушку
+        """
+        with mock.patch.object(thumbnails, 'enqueue') as enqueue:
+            self.upload()
+            cache.clear()
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Изображение обрабатывается')
+        self.assertNotContains(response, 'img class="card-img"')
+        name, geometry, options = enqueue.call_args[0]
+        self.assertTrue(name.startswith('posts/red'))
+        self.assertEqual(geometry, '960x339')
+        self.assertEqual(options, {'crop': 'center', 'upscale': True})
+
+    def test_worker_renders_with_real_backend(self):
+        """Поток пула строит миниатюру обычным бэкендом sorl"""
+        calls = []
+
+        def render(backend, file_, geometry, **options):
+            calls.append((file_, geometry, thumbnails._rendering_allowed()))
+
+        key = thumbnails._key('posts/red.jpg', '960x339', {})
+        thumbnails._pending.add(key)
+        with mock.patch.object(
+            thumbnails.ThumbnailBackend, 'get_thumbnail', render
+        ):
+            thumbnails._render('posts/red.jpg', '960x339', {})
+        self.assertEqual(calls, [('posts/red.jpg', '960x339', True)])
+        self.assertNotIn(key, thumbnails._pending)
+        self.assertFalse(thumbnails._rendering_allowed())
+
+
+class ImageVariantsTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='painter',
+            password='s12crac##kle345'
+        )
+        self.client.force_login(self.user)
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(buffer, 'JPEG')
+        image = SimpleUploadedFile(
+            'red.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+        self.client.post(
+            reverse('new_post'),
+            data={'text': 'With picture', 'image': image}
+        )
+        self.post = Post.objects.get()
+
+    def test_variants_built_and_rendered(self):
+        """
+        Для картинки строятся WebP и JPEG нужных ширин без увеличения,
+        карточка отдаёт их через srcset с размерами и lazy-загрузкой
+        """
+        self.assertTrue(variants.build(self.post.pk, self.post.image.name))
+        post = Post.objects.get()
+        picture = post.picture
+        self.assertEqual(
+            [source['type'] for source in picture['sources']],
+            ['image/webp']
+        )
+        self.assertIn('960w', picture['srcset'])
+        self.assertNotIn('1280w', picture['srcset'])
+        self.assertTrue(picture['src'].endswith('-960.jpeg'))
+        with Image.open(f'{self.media}/posts/variants/red-640.webp') as img:
+            self.assertEqual(img.size, (640, 226))
+        with mock.patch.object(thumbnails, 'enqueue') as enqueue:
+            response = self.client.get(reverse('index'))
+        enqueue.assert_not_called()
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_stale_variants_ignored(self):
+        """Варианты старой картинки не показываются для новой"""
+        self.assertFalse(variants.build(self.post.pk, 'posts/other.jpg'))
+        self.assertEqual(Post.objects.get().image_variants, '')
+        variants.build(self.post.pk, self.post.image.name)
+        Post.objects.update(image='posts/other.jpg')
+        self.assertIsNone(Post.objects.get().picture)
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        fragments.fragment_cache().clear()
+        fragments.reset_stats()
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username='carded',
+            password='s12crac##kle345'
+        )
+        self.reader = User.objects.create_user(username='card_reader')
+        self.post = Post.objects.create(text='Cached card', author=self.author)
+
+    def index(self):
+        cache.clear()
+        return self.client.get(reverse('index'))
+
+    def test_page_served_from_cache(self):
+        """Повторный показ ленты не рендерит карточки заново"""
+        self.index()
+        with mock.patch.object(fragments, 'get_template') as get_template:
+            response = self.index()
+        self.assertContains(response, 'Cached card')
+        get_template.return_value.render.assert_not_called()
+        self.assertEqual(
+            fragments.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+        )
+
+    def test_version_bumped(self):
+        """Правка записи и новый комментарий меняют карточку"""
+        self.index()
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('post_edit', kwargs={
+                'username': 'carded', 'post_id': self.post.id
+            }),
+            data={'text': 'Edited card'}
+        )
+        response = self.index()
+        self.assertContains(response, 'Edited card')
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='First'
+        )
+        response = self.index()
+        self.assertContains(response, 'Количество комментариев 1')
+
+    def test_rename_bumped(self):
+        """Переименование группы и автора меняет карточки и ленты"""
+        group = Group.objects.create(title='Old title', slug='renamed')
+        self.post.group = group
+        self.post.save()
+        index = reverse('index')
+        self.client.get(index)
+        group.title = 'New title'
+        group.save()
+        self.assertContains(self.client.get(index), '#New title')
+        self.author.username = 'recarded'
+        self.author.save()
+        self.assertContains(self.client.get(index), '@recarded')
+        version = Post.objects.get(pk=self.post.pk).version
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, version)
+
+    def test_viewer_variants(self):
+        """Ссылку на правку видит только автор записи"""
+        edit = reverse('post_edit', kwargs={
+            'username': 'carded', 'post_id': self.post.id
+        })
+        self.assertNotContains(self.index(), edit)
+        self.client.force_login(self.author)
+        self.assertContains(self.index(), edit)
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.index(), edit)
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='paged')
+        self.reader = User.objects.create_user(username='page_reader')
+        self.first = Group.objects.create(
+            title='First', slug='first', description='First group'
+        )
+        self.second = Group.objects.create(
+            title='Second', slug='second', description='Second group'
+        )
+        self.post = Post.objects.create(
+            text='Moving post', author=self.author, group=self.first
+        )
+
+    def group_page(self, group):
+        return self.client.get(
+            reverse('group_posts', kwargs={'slug': group.slug})
+        )
+
+    def test_group_change(self):
+        """Перенос записи обновляет ленты обеих групп"""
+        self.assertContains(self.group_page(self.first), 'Moving post')
+        self.assertNotContains(self.group_page(self.second), 'Moving post')
+        self.post.group = self.second
+        self.post.save()
+        self.assertNotContains(self.group_page(self.first), 'Moving post')
+        self.assertContains(self.group_page(self.second), 'Moving post')
+
+    def test_comment_and_follow(self):
+        """Комментарий и подписка обновляют главную и профиль"""
+        profile = reverse('profile_view', kwargs={'username': 'paged'})
+        self.client.get(reverse('index'))
+        self.client.get(profile)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Hello'
+        )
+        self.assertContains(
+            self.client.get(reverse('index')), 'Количество комментариев 1'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(profile)
+        self.assertEqual(response.context['stats'].followers_count, 1)
+
+    def test_generations_survive_clear(self):
+        """После очистки кэша поколения не повторяются"""
+        before = pagecache.generations(['global'])
+        cache.clear()
+        self.assertGreater(pagecache.generations(['global']), before)
+
+
+class SharedCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.cache = SQLiteCache(
+            f'{directory}/cache.sqlite3',
+            {'OPTIONS': {'STALE_TIMEOUT': 60, 'LOCK_TIMEOUT': 5}}
+        )
+
+    def test_basic_api(self):
+        """Бэкенд ведёт себя как обычный кэш Django"""
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('b', 2))
+        self.assertEqual(self.cache.incr('b', 3), 5)
+        self.cache.set('gone', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 3))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': {'x': 1}, 'b': 5})
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_single_flight(self):
+        """Одновременный промах считает значение один раз"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        threads = [
+            threading.Thread(
+                target=self.cache.get_or_recompute, args=('page', compute)
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.get('page'), 'page')
+
+    def test_stale_while_revalidate(self):
+        """Пока пересчёт занят, отдаётся устаревшее значение"""
+        self.cache.get_or_recompute('page', lambda: 'old', timeout=-1)
+        self.assertIsNone(self.cache.get('page'))
+        key = self.cache.make_key('page')
+        self.assertTrue(self.cache._acquire(key, 'other'))
+        self.assertEqual(
+            self.cache.get_or_recompute('page', lambda: 'new'), 'old'
+        )
+        self.cache._release(key, 'other')
+        self.assertEqual(
+            self.cache.get_or_recompute('page', lambda: 'new'), 'new'
+        )
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='validated')
+        self.reader = User.objects.create_user(username='revalidating')
+        self.post = Post.objects.create(text='Validated', author=self.author)
+        self.post_url = reverse('post_view', kwargs={
+            'username': 'validated', 'post_id': self.post.id
+        })
+
+    def test_feed_not_modified(self):
+        """Совпавший ETag главной даёт 304 без запросов к базе"""
+        url = reverse('index')
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='Fresh', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Fresh')
+
+    def test_feed_modified_since(self):
+        """Last-Modified сдвигается с каждым изменением ленты"""
+        url = reverse('index')
+        clock = [pagecache._now() + 10 * 1000000]
+        with mock.patch.object(pagecache, '_now', lambda: clock[0]):
+            pagecache.bump(['global'])
+            # в первую секунду после изменения даты ещё нет
+            self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+            clock[0] += 5 * 1000000
+            since = self.client.get(url)['Last-Modified']
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, 304)
+            Post.objects.create(text='Fresh', author=self.author)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertContains(response, 'Fresh')
+            clock[0] += 5 * 1000000
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertContains(response, 'Fresh')
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_viewer_in_etag(self):
+        """Страница гостя не подходит вошедшему пользователю"""
+        etag = self.client.get(reverse('index'))['ETag']
+        self.client.force_login(self.reader)
+        response = self.client.get(
+            reverse('index'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_post_view(self):
+        """Страница записи сверяется по её версии без рендеринга"""
+        etag = self.client.get(self.post_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Changed'
+        )
+        response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Changed')
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='exported')
+        self.other = User.objects.create_user(username='skipped')
+        self.group = Group.objects.create(
+            title='Export', slug='export', description='Export group'
+        )
+        for i in range(5):
+            Post.objects.create(
+                text=f'export {i}', author=self.author, group=self.group
+            )
+        Post.objects.create(text='other', author=self.other)
+        Post.objects.filter(text='export 0').update(
+            pub_date='2020-01-01 12:00:00+00:00'
+        )
+
+    def run_export(self, *args):
+        out = StringIO()
+        call_command('export', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_ndjson_in_batches(self):
+        """Выгрузка идёт пачками по id, число запросов — по пачкам"""
+        with self.assertNumQueries(3):
+            lines = self.run_export(
+                'posts', '--author', 'exported', '--batch-size', '2'
+            ).splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row['text'] for row in rows],
+            [f'export {i}' for i in range(5)]
+        )
+        self.assertEqual(rows[0]['group'], 'export')
+        self.assertEqual(rows[0]['author'], 'exported')
+
+    def test_filters_and_csv(self):
+        """CSV с фильтром по группе и датам"""
+        output = self.run_export(
+            'posts', '--format', 'csv', '--group', 'export',
+            '--since', '2020-01-01', '--until', '2020-01-01'
+        )
+        header, row = output.splitlines()
+        self.assertTrue(header.startswith('id,author,group,pub_date'))
+        self.assertIn('export 0', row)
+        self.assertIn('2020-01-01T12:00:00', row)
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+
+    def run_import(self, rows, *args):
+        path = f'{self.source}/import.ndjson'
+        with open(path, 'w', encoding='utf-8') as stream:
+            for row in rows:
+                stream.write(
+                    row if isinstance(row, str) else json.dumps(row)
+                )
+                stream.write('\n')
+        out = StringIO()
+        call_command(
+            'import_posts', path, '--batch-size', '2', *args,
+            stdout=out, stderr=StringIO()
+        )
+        return out.getvalue()
+
+    def test_import(self):
+        """Импорт сохраняет даты, копирует картинки и пересобирает данные"""
+        with open(f'{self.source}/old.jpg', 'wb') as image:
+            Image.new('RGB', (10, 10), 'red').save(image, 'JPEG')
+        rows = [
+            {'type': 'group', 'slug': 'old', 'title': 'Old'},
+            {'type': 'user', 'username': 'veteran'},
+            {'type': 'post', 'id': 'a1', 'author': 'veteran',
+             'group': 'old', 'text': 'historical essay',
+             'pub_date': '2015-03-01T10:00:00+00:00', 'image': 'old.jpg'},
+            {'type': 'post', 'id': 'a2', 'author': 'veteran',
+             'text': 'second essay', 'pub_date': '2015-03-02'},
+            {'type': 'comment', 'post': 'a1', 'author': 'reader',
+             'text': 'old reply', 'created': '2015-03-03'},
+            {'type': 'comment', 'post': 'lost', 'author': 'reader',
+             'text': 'orphan'},
+            {'type': 'post', 'author': 'nobody', 'text': 'skipped'},
+            'not json',
+            {'type': 'follow', 'user': 'reader', 'author': 'veteran'},
+        ]
+        self.assertIn('строк/с', self.run_import(
+            rows, '--media-root', self.source
+        ))
+        essay = Post.objects.get(text='historical essay')
+        self.assertEqual(essay.pub_date.year, 2015)
+        self.assertEqual(essay.group.slug, 'old')
+        self.assertEqual(essay.comment_count, 1)
+        self.assertTrue(essay.image.storage.exists(essay.image.name))
+        self.assertEqual(
+            essay.comments.get().created.date().isoformat(), '2015-03-03'
+        )
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        veteran = User.objects.get(username='veteran')
+        self.assertFalse(veteran.has_usable_password())
+        self.assertEqual(veteran.stats.posts_count, 2)
+        self.assertEqual(veteran.stats.followers_count, 1)
+        self.assertEqual(self.reader.timeline.count(), 2)
+        response = self.client.get(reverse('search'), {'q': 'historical'})
+        self.assertContains(response, 'historical essay')
+
+    def test_conflicts_rejected(self):
+        """
+        Группа с занятым названием отклоняется как плохая строка,
+        подписки считаются по вставленным
+        """
+        Group.objects.create(title='Taken', slug='taken')
+        User.objects.create_user(username='writer')
+        Follow.objects.create(
+            user=self.reader, author=User.objects.get(username='writer')
+        )
+        rows = [
+            {'type': 'group', 'slug': 'taken', 'title': 'Taken'},
+            {'type': 'group', 'slug': 'copy', 'title': 'Taken'},
+            {'type': 'group', 'slug': 'fresh', 'title': 'Fresh'},
+            {'type': 'group', 'slug': 'twin', 'title': 'Fresh'},
+            {'type': 'follow', 'user': 'reader', 'author': 'writer'},
+            {'type': 'follow', 'user': 'writer', 'author': 'reader'},
+            {'type': 'follow', 'user': 'writer', 'author': 'reader'},
+        ]
+        out = self.run_import(rows)
+        self.assertIn('group: 1', out)
+        self.assertIn('follow: 1', out)
+        self.assertIn('ошибок: 2', out)
+        self.assertEqual(
+            sorted(Group.objects.values_list('slug', flat=True)),
+            ['fresh', 'taken']
+        )
+
+    def test_export_round_trip(self):
+        """Выгрузка export загружается обратно с --type"""
+        author = User.objects.create_user(username='exported')
+        for i in range(3):
+            Post.objects.create(text=f'round trip {i}', author=author)
+        out = StringIO()
+        call_command('export', 'posts', stdout=out, stderr=StringIO())
+        Post.objects.all().delete()
+        self.run_import(out.getvalue().splitlines(), '--type', 'post')
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            [f'round trip {i}' for i in range(3)]
+        )
+        self.assertEqual(author.stats.posts_count, 3)
+
+
+class QueryPlanMixin:
+    """
+    Снимает EXPLAIN QUERY PLAN со всех запросов страницы и падает,
+    если какой-то из них читает таблицу целиком или сортирует
+    во временном B-дереве.
+    """
+    # маленькие справочники, которые можно читать целиком
+    SCAN_ALLOWED = ()
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def bad_steps(self, sql):
+        steps = self.plan(sql)
+        # ранжирование FTS5 сортирует только совпавшие строки
+        ranked = any('VIRTUAL TABLE' in step for step in steps)
+        bad = []
+        for step in steps:
+            words = step.split()
+            if 'VIRTUAL TABLE' in step:
+                continue
+            if 'TEMP B-TREE' in step:
+                if not ranked:
+                    bad.append(step)
+            # SCAN (subquery-N) читает уже выбранные строки, не таблицу
+            elif (words[0] == 'SCAN' and len(words) == 2
+                  and not words[1].startswith('(')
+                  and words[1] not in self.SCAN_ALLOWED):
+                bad.append(step)
+        return bad
+
+    def assertPlans(self, url, client=None, data=None, allowed=()):
+        cache.clear()
+        caches['fragments'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(url, data)
+        self.assertEqual(response.status_code, 200, url)
+        problems = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.split(None, 1)[0].upper() not in (
+                'SELECT', 'UPDATE', 'DELETE'
+            ):
+                continue
+            bad = [step for step in self.bad_steps(sql) if step not in allowed]
+            if bad:
+                problems.append(f'{sql}\n    {bad}')
+        self.assertFalse(problems, f'{url}:\n' + '\n'.join(problems))
+        return response
+
+
+class QueryPlanTest(QueryPlanMixin, TestCase):
+    SCAN_ALLOWED = ('posts_group',)
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username='planned', password='s12crac##kle345'
+        )
+        self.reader = User.objects.create_user(username='planner')
+        self.group = Group.objects.create(
+            title='Plans', slug='plans', description='Plans'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.posts = [
+            Post.objects.create(
+                text=f'planned post {i}', author=self.author,
+                group=self.group if i % 2 else None
+            )
+            for i in range(24)
+        ]
+        Comment.objects.create(
+            post=self.posts[-1], author=self.reader, text='planned comment'
+        )
+        self.client.force_login(self.reader)
+
+    def test_pages(self):
+        """Страницы сайта читают таблицы по индексам без сортировки"""
+        post = self.posts[-1]
+        feeds = [
+            reverse('index'),
+            reverse('group_posts', args=['plans']),
+            reverse('profile_view', args=['planned']),
+        ]
+        for url in feeds:
+            with self.subTest(url=url):
+                page = self.assertPlans(url).context['page']
+                self.assertPlans(url, data={'cursor': page.next_cursor})
+        for url in (
+            reverse('post_view', args=['planned', post.id]),
+            reverse('follower_view', args=['planner']),
+            reverse('following_view', args=['planned']),
+            reverse('new_post'),
+        ):
+            with self.subTest(url=url):
+                self.assertPlans(url)
+        comments = reverse('post_comments', args=['planned', post.id])
+        comment = post.comments.get()
+        reply = Comment.objects.create(
+            post=post, author=self.author, text='planned reply',
+            parent=comment
+        )
+        cursor = encode_cursor([comment.created, comment.id])
+        for order in ('old', 'new'):
+            self.assertPlans(comments, data={'order': order})
+            self.assertPlans(comments, data={'order': order, 'cursor': cursor})
+        thread = reverse(
+            'comment_thread', args=['planned', post.id, comment.id]
+        )
+        self.assertPlans(thread)
+        self.assertPlans(thread, data={'cursor': encode_cursor([reply.path])})
+        self.assertPlans(reverse('search'), data={'q': 'planned'})
+        author = Client()
+        author.force_login(self.author)
+        self.assertPlans(
+            reverse('post_edit', args=['planned', post.id]), author
+        )
+
+    def test_follow_engines(self):
+        """
+        Все движки ленты подписок, которые выбирает FEED_ENGINE;
+        query сортирует записи всех авторов по дате, остальное
+        в его плане проверяется как у других движков
+        """
+        for engine in feeds.ENGINES:
+            allowed = ('USE TEMP B-TREE FOR ORDER BY',) if (
+                engine == 'query'
+            ) else ()
+            with self.subTest(engine=engine):
+                with self.settings(FEED_ENGINE=engine):
+                    self.assertPlans(
+                        reverse('follow_index'), allowed=allowed
+                    )
+
+
+class SQLiteTuningTest(TestCase):
+    def pragma(self, cursor, name):
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+    def test_connection_configured(self):
+        """Соединение тестовой базы получило PRAGMA из SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            self.assertEqual(self.pragma(cursor, 'synchronous'), 1)
+            self.assertEqual(self.pragma(cursor, 'temp_store'), 2)
+            self.assertEqual(self.pragma(cursor, 'busy_timeout'), 5000)
+            self.assertEqual(self.pragma(cursor, 'cache_size'), -65536)
+
+    def test_file_database(self):
+        """Файловая база переходит в WAL и читается через mmap"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        raw = sqlite3.connect(f'{directory}/tuned.sqlite3')
+        self.addCleanup(raw.close)
+        db.apply(raw, {'journal_mode': 'wal', 'mmap_size': 1 << 20})
+        cursor = raw.cursor()
+        self.assertEqual(self.pragma(cursor, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(cursor, 'mmap_size'), 1 << 20)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    # реплика — второе соединение к той же базе: в транзакции TestCase
+    # она упиралась бы в блокировки таблиц общего кэша SQLite
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='replicated', password='s12crac##kle345'
+        )
+        Post.objects.create(text='replicated post', author=self.user)
+
+    def queries(self, alias, url):
+        cache.clear()
+        with CaptureQueriesContext(connections[alias]) as queries:
+            self.client.get(url)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_reads_from_replica(self):
+        """Ленты читаются с реплики, вне запроса — из default"""
+        profile = reverse('profile_view', args=['replicated'])
+        self.assertTrue(any(
+            'posts_post' in sql for sql in self.queries('replica', profile)
+        ))
+        self.assertEqual(
+            routers.ReplicaRouter().db_for_read(Post), 'default'
+        )
+
+    def test_read_your_writes(self):
+        """После записи сессия какое-то время читает из default"""
+        self.client.force_login(self.user)
+        self.client.post(reverse('new_post'), {'text': 'fresh post'})
+        profile = reverse('profile_view', args=['replicated'])
+        self.assertEqual(self.queries('replica', profile), [])
+        session = self.client.session
+        session[routers.PIN_KEY] = time.time() - 1
+        session.save()
+        self.assertNotEqual(self.queries('replica', profile), [])
+
+    def test_only_safe_feed_reads(self):
+        """POST и страницы вне REPLICA_VIEWS читают только default"""
+        post = Post.objects.get()
+        self.assertEqual(self.queries(
+            'replica', reverse('post_view', args=['replicated', post.id])
+        ), [])
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            self.client.post(
+                reverse('post_edit', args=['replicated', post.id]),
+                {'text': 'edited'}
+            )
+        self.assertEqual(queries.captured_queries, [])
+
+    def test_auth_reads_from_default(self):
+        """
+        После смены пароля и истечения прилипания пользователь
+        остаётся в системе: его запись не читается с реплики
+        """
+        self.client.login(username='replicated', password='s12crac##kle345')
+        response = self.client.post(reverse('password_change'), {
+            'old_password': 's12crac##kle345',
+            'new_password1': 'n3w##passw0rd',
+            'new_password2': 'n3w##passw0rd',
+        })
+        self.assertRedirects(response, reverse('password_change_done'))
+        session = self.client.session
+        session[routers.PIN_KEY] = time.time() - 1
+        session.save()
+        follow = reverse('follow_index')
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(follow)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries.captured_queries)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'FROM "auth_user"' in query['sql']
+            or 'FROM "django_session"' in query['sql']
+        ])
+
+    def test_caches_not_filled_from_replica(self):
+        """
+        Страница с реплики устаревает с синхронизацией, кэши
+        карточек и последних записей с реплики не заполняются
+        """
+        index = reverse('index')
+        caches['fragments'].clear()
+        etag = self.client.get(index)['ETag']
+        self.assertIsNone(fragments.fragment_cache().get(
+            fragments.card_key(Post.objects.get(), AnonymousUser())
+        ))
+        pagecache.bump([pagecache.replica_scope('replica')])
+        response = self.client.get(index, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        routers._state.replica = 'replica'
+        try:
+            author_recent([self.user.pk])
+        finally:
+            routers._state.replica = None
+        self.assertIsNone(
+            recent_cache().get(RECENT_KEY.format(self.user.pk))
+        )
+
+    def test_sync_replica(self):
+        """sync_replica копирует файл основной базы в файл реплики"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        primary = sqlite3.connect(f'{directory}/primary.sqlite3')
+        primary.execute('CREATE TABLE copied (value TEXT)')
+        primary.execute("INSERT INTO copied VALUES ('synced')")
+        primary.commit()
+        primary.close()
+        with mock.patch.dict(connections['default'].settings_dict,
+                             NAME=f'{directory}/primary.sqlite3'), \
+                mock.patch.dict(connections['replica'].settings_dict,
+                                NAME=f'{directory}/replica.sqlite3'):
+            call_command('sync_replica', stdout=StringIO())
+        replica = sqlite3.connect(f'{directory}/replica.sqlite3')
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT value FROM copied').fetchall(),
+            [('synced',)]
+        )
+
+
+class SeedTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_seed(self):
+        """seed создаёт данные заданного размера со степенным распределением"""
+        call_command(
+            'seed', '--users', '30', '--groups', '3', '--posts', '300',
+            '--comments', '200', '--follows', '100', '--images', '2',
+            '--image-ratio', '0.2', stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(0 < Follow.objects.count() <= 100)
+        top = UserStats.objects.order_by('-posts_count').first()
+        # самый активный автор пишет намного больше среднего (10)
+        self.assertGreater(top.posts_count, 40)
+        with_image = Post.objects.exclude(image='')
+        self.assertTrue(with_image.exists())
+        image = with_image.first().image
+        self.assertTrue(image.storage.exists(image.name))
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            sum(
+                UserStats.objects.get(user_id=author).posts_count
+                for author in Follow.objects.values_list(
+                    'author', flat=True
+                )
+            )
+        )
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = self.settings(
+            METRICS_DIR=directory, METRICS_TOKEN='scrape-token'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics._views.clear()
+        self.addCleanup(metrics._views.clear)
+        self.directory = directory
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='measured')
+        self.post = Post.objects.create(text='Measured', author=self.user)
+
+    def scrape(self):
+        return self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token'
+        ).content.decode()
+
+    def test_metrics(self):
+        """Счётчики по имени URL отдаются в формате Prometheus"""
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.get(reverse('post_view', args=['measured', self.post.id]))
+        self.client.get('/missing/page/nowhere/')
+        body = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="index"} 2', body
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="index"} 2', body
+        )
+        self.assertIn('status="404",view="unmatched"', body)
+        stats = metrics._views['post_view']
+        self.assertGreater(stats['db_queries'], 0)
+        self.assertGreater(stats['response_bytes'], 0)
+        self.assertGreater(metrics._views['index']['cache_hits'], 0)
+        self.assertGreater(metrics._views['index']['cache_misses'], 0)
+
+    def test_workers_aggregated(self):
+        """Снимки других процессов суммируются, мёртвые уходят в архив"""
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        snapshot = {'index': dict(metrics._empty(), requests={'200': 5})}
+        snapshot['index']['buckets'][0] = 5
+        with open(f'{self.directory}/{dead.pid}.json', 'w') as output:
+            json.dump(snapshot, output)
+        self.client.get(reverse('index'))
+        body = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="index"} 6', body
+        )
+        self.assertFalse(os.path.exists(f'{self.directory}/{dead.pid}.json'))
+        body = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="index"} 6', body
+        )
+
+    def test_forbidden(self):
+        """
+        Метрики видны сотрудникам и по токену, но не по адресу:
+        за прокси все приходят с 127.0.0.1
+        """
+        url = reverse('metrics')
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403
+        )
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong'
+        ).status_code, 403)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(
+                url, HTTP_AUTHORIZATION='Bearer None'
+            ).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ProfilerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = self.settings(PROFILER_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.client = Client()
+        self.staff = User.objects.create_user(
+            username='profiled', is_staff=True
+        )
+        self.post = Post.objects.create(text='Profiled', author=self.staff)
+        self.url = reverse('post_view', args=['profiled', self.post.id])
+
+    def profiles(self):
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith('.json')
+        )
+
+    def test_staff_header(self):
+        """Сотрудник получает профиль и SQL своего запроса"""
+        self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(self.profiles(), [])
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        stem = response['X-Profile-Id']
+        self.assertIn('post_view', stem)
+        with open(f'{self.directory}/{stem}.json') as source:
+            profile = json.load(source)
+        self.assertEqual(profile['view'], 'post_view')
+        self.assertTrue(any(
+            'posts_post' in query['sql'] for query in profile['queries']
+        ))
+        with open(f'{self.directory}/{stem}.collapsed') as source:
+            for line in source:
+                self.assertTrue(line.startswith('view:post_view;'))
+
+    def test_sampler(self):
+        """Выборочный профилировщик видит функцию, в которой идёт время"""
+        def slow_function():
+            time.sleep(0.05)
+
+        with profiler.Sampler(threading.get_ident(), 0.001) as sampler:
+            slow_function()
+        self.assertTrue(any(
+            stack.endswith('tests.py:slow_function')
+            for stack in sampler.stacks
+        ))
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_MAX_FILES=2)
+    def test_sample_rate_and_rotation(self):
+        """Доля запросов профилируется, каталог не растёт"""
+        for _ in range(3):
+            self.client.get(self.url)
+        self.assertEqual(len(self.profiles()), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.log = os.path.join(directory, 'slow.ndjson')
+        settings_override = self.settings(
+            SLOW_QUERY_LOG=self.log, SLOW_QUERY_MS=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        slowlog.install(None, connection)
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='slow')
+        self.post = Post.objects.create(text='Slow', author=self.user)
+
+    def entries(self):
+        with open(self.log) as source:
+            return [json.loads(line) for line in source]
+
+    def test_fingerprint(self):
+        """Значения и длина списка IN не меняют fingerprint"""
+        self.assertEqual(
+            slowlog.fingerprint(
+                "SELECT a FROM t WHERE id IN (%s, %s, %s) AND b = 'x'"
+                "  LIMIT 21"
+            ),
+            slowlog.fingerprint(
+                "SELECT a FROM t WHERE id IN (%s, %s) AND b = 'y' LIMIT 3"
+            ),
+        )
+        self.assertEqual(
+            slowlog.fingerprint('SELECT a FROM t WHERE id IN (%s, %s)'),
+            'SELECT a FROM t WHERE id IN (...)'
+        )
+
+    def test_log_entry(self):
+        """Запись журнала: имя URL, параметры и план запроса"""
+        self.client.get(reverse('post_view', args=['slow', self.post.id]))
+        entries = [
+            entry for entry in self.entries()
+            if entry['view'] == 'post_view'
+            and entry['fingerprint'].startswith('SELECT')
+        ]
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['plan'] for entry in entries))
+        self.assertTrue(any(
+            self.post.id in entry['params'] for entry in entries
+        ))
+
+    def test_threshold(self):
+        """Быстрые запросы не пишутся, команда сводит журнал"""
+        os.remove(self.log)
+        with self.settings(SLOW_QUERY_MS=None):
+            Post.objects.count()
+        self.assertFalse(os.path.exists(self.log))
+        for _ in range(3):
+            list(Post.objects.filter(pk=self.post.id))
+        out = StringIO()
+        call_command('slow_queries', '--plans', stdout=out)
+        output = out.getvalue()
+        self.assertRegex(output, r'\n\s+3 .*FROM "posts_post" WHERE')
+        self.assertIn('views: background', output)
+        self.assertIn('plan: SEARCH', output)
+
+
+class CommentPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='discussed')
+        self.post = Post.objects.create(text='Discussed', author=self.author)
+        readers = [
+            User.objects.create_user(username=f'reader{i}') for i in range(5)
+        ]
+        self.comments = [
+            Comment.objects.create(
+                post=self.post, author=readers[i % 5], text=f'comment {i}'
+            )
+            for i in range(45)
+        ]
+        self.url = reverse('post_view', args=['discussed', self.post.id])
+        self.fragment = reverse(
+            'post_comments', args=['discussed', self.post.id]
+        )
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_chunks(self):
+        """Страница отдаёт первую порцию, остальное — фрагмент"""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            self.texts(response), [f'comment {i}' for i in range(20)]
+        )
+        self.assertContains(response, 'data-fragment')
+        response = self.client.get(
+            f'{self.fragment}?{response.context["comments_next"]}'
+        )
+        self.assertNotContains(response, '<html')
+        self.assertEqual(
+            self.texts(response), [f'comment {i}' for i in range(20, 40)]
+        )
+        response = self.client.get(
+            f'{self.fragment}?{response.context["comments_next"]}'
+        )
+        self.assertEqual(
+            self.texts(response), [f'comment {i}' for i in range(40, 45)]
+        )
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_newest_first(self):
+        """?order=new показывает сначала новые комментарии"""
+        response = self.client.get(self.url, {'order': 'new'})
+        self.assertEqual(
+            self.texts(response)[:2], ['comment 44', 'comment 43']
+        )
+        response = self.client.get(
+            f'{self.fragment}?{response.context["comments_next"]}'
+        )
+        self.assertEqual(self.texts(response)[0], 'comment 24')
+
+    def test_queries_do_not_grow(self):
+        """Авторы комментариев не добавляют запросов на строку"""
+        other = Post.objects.create(text='Quiet', author=self.author)
+        Comment.objects.bulk_create(
+            Comment(post=other, author=self.author, text='same author')
+            for _ in range(25)
+        )
+        quiet = reverse('post_comments', args=['discussed', other.id])
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(quiet)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.fragment)
+        self.assertEqual(len(single), len(many))
+
+    def test_add_comment_redirect(self):
+        """После комментария автор видит его первым"""
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('add_comment', args=['discussed', self.post.id]),
+            {'text': 'latest'}
+        )
+        latest = Comment.objects.get(text='latest')
+        self.assertRedirects(
+            response, f'{self.url}?order=new#comment_{latest.id}',
+            fetch_redirect_response=False
+        )
+        response = self.client.get(self.url, {'order': 'new'})
+        self.assertEqual(self.texts(response)[0], 'latest')
+        response = self.client.post(
+            reverse('add_comment', args=['discussed', self.post.id]),
+            {'text': ''}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(len(self.texts(response)), 20)
+
+
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username='threaded')
+        self.reader = User.objects.create_user(username='replier')
+        self.post = Post.objects.create(text='Threaded', author=self.author)
+        self.root = Comment.objects.create(
+            post=self.post, author=self.author, text='root'
+        )
+        self.url = reverse('post_view', args=['threaded', self.post.id])
+
+    def reply(self, parent, text):
+        return Comment.objects.create(
+            post=self.post, author=self.reader, text=text, parent=parent
+        )
+
+    def test_path_and_counts(self):
+        """Путь, глубина и счётчики ответов предков"""
+        first = self.reply(self.root, 'first')
+        nested = self.reply(first, 'nested')
+        second = self.reply(self.root, 'second')
+        self.assertEqual(self.root.path, '')
+        self.assertEqual(
+            nested.path,
+            f'{self.root.id:010d}/{first.id:010d}/{nested.id:010d}'
+        )
+        self.assertEqual(nested.depth, 2)
+        self.root.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((self.root.reply_count, first.reply_count), (3, 1))
+        subtree = Comment.objects.filter(
+            threads.subtree_filter(self.root)
+        ).order_by('path')
+        self.assertEqual(
+            [comment.text for comment in subtree],
+            ['first', 'nested', 'second']
+        )
+        first.delete()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+    def test_max_depth(self):
+        """Слишком глубокий ответ становится ответом предку"""
+        with mock.patch.object(threads, 'MAX_DEPTH', 2):
+            first = self.reply(self.root, 'first')
+            nested = self.reply(first, 'nested')
+            deeper = self.reply(nested, 'deeper')
+        self.assertEqual(deeper.parent_id, first.id)
+        self.assertEqual(deeper.depth, 2)
+
+    def test_page_threads(self):
+        """Ветки приходят одним запросом, глубокие свёрнуты"""
+        parent = self.root
+        for level in range(threads.VISIBLE_DEPTH + 2):
+            parent = self.reply(parent, f'level {level + 1}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        root = response.context['comments'][0]
+        self.assertEqual(
+            [reply.depth for reply in root.thread],
+            list(range(1, threads.VISIBLE_DEPTH + 1))
+        )
+        self.assertTrue(root.thread[-1].collapsed)
+        self.assertNotContains(response, f'level {threads.VISIBLE_DEPTH + 1}')
+        self.assertEqual(
+            sum('"path" >' in query['sql'] for query in queries), 1
+        )
+        hidden = root.thread[-1]
+        response = self.client.get(reverse(
+            'comment_thread', args=['threaded', self.post.id, hidden.id]
+        ))
+        self.assertNotContains(response, '<html')
+        self.assertEqual(
+            [reply.text for reply in response.context['comments']],
+            [f'level {threads.VISIBLE_DEPTH + 1}',
+             f'level {threads.VISIBLE_DEPTH + 2}']
+        )
+
+    def test_inline_limit(self):
+        """Большая ветка на странице свёрнута в ссылку"""
+        with mock.patch.object(threads, 'INLINE_LIMIT', 2):
+            for i in range(3):
+                self.reply(self.root, f'reply {i}')
+            response = self.client.get(self.url)
+        root = response.context['comments'][0]
+        self.assertTrue(root.collapsed)
+        self.assertEqual(root.thread, [])
+        self.assertContains(response, 'Показать ответы (3)')
+
+    def test_add_reply(self):
+        """Ответ через форму комментария ведёт к своей ветке"""
+        self.client.force_login(self.reader)
+        add = reverse('add_comment', args=['threaded', self.post.id])
+        response = self.client.get(add, {'parent': self.root.id})
+        self.assertContains(response, 'Ответ @threaded')
+        self.assertEqual(len(response.context['form'].fields), 1)
+        for i in range(25):
+            Comment.objects.create(
+                post=self.post, author=self.author, text=f'later {i}'
+            )
+        response = self.client.post(
+            add, {'text': 'my reply', 'parent': self.root.id}, follow=True
+        )
+        reply = Comment.objects.get(text='my reply')
+        self.assertEqual(reply.parent, self.root)
+        root = response.context['comments'][0]
+        self.assertEqual(root.id, self.root.id)
+        self.assertEqual([comment.text for comment in root.thread],
+                         ['my reply'])
+        other = Post.objects.create(text='Other', author=self.author)
+        foreign = Comment.objects.create(
+            post=other, author=self.author, text='foreign'
+        )
+        response = self.client.post(
+            add, {'text': 'stray', 'parent': foreign.id}
+        )
+        self.assertEqual(response.status_code, 404)
+        for parent in ('x', '²', '٣', str(2 ** 64)):
+            with self.subTest(parent=parent):
+                response = self.client.post(
+                    add, {'text': 'stray', 'parent': parent}
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class TestCacheDirTest(TestCase):
+    def test_cache_outside_project(self):
+        """Тесты пишут кэш во временный каталог, а не в .cache проекта"""
+        self.assertNotEqual(
+            settings.CACHE_DIR, os.path.join(settings.BASE_DIR, '.cache')
+        )
+        for alias in settings.CACHES:
+            with self.subTest(alias=alias):
+                self.assertTrue(
+                    caches[alias]._path.startswith(settings.CACHE_DIR)
+                )
+        self.assertTrue(metrics.directory().startswith(settings.CACHE_DIR))
+        self.assertTrue(slowlog.log_path().startswith(settings.CACHE_DIR))
@@ -0,0 +1,138 @@
+"""
+Ветки ответов на комментарии с материализованным путём.
+
+У ответа Comment.path — id всех предков и его собственный, по
+SEGMENT цифр через '/', например 0000000007/0000000012. Корневые
+комментарии пути не хранят (node_path() — их id), поэтому
+массовый импорт и API создают их как раньше. Ответы одного
+комментария — это пути в диапазоне (path + '/', path + '0'):
+'/' в ASCII идёт сразу перед цифрами, так что поддерево читается
+одним диапазоном по индексу comment_path_idx и уже в порядке
+показа — в глубину, ответы по времени.
+
+Путь, глубину и счётчики ставят сигналы: place() до вставки
+ответа выбирает родителя и глубину, attach() после вставки
+дописывает путь (нужен id) и увеличивает reply_count у всех
+предков одним UPDATE, detach() при удалении уменьшает его.
+
+На странице под каждым корневым комментарием показываются ответы
+до VISIBLE_DEPTH уровня и только у веток не больше INLINE_LIMIT
+ответов; остальное свёрнуто в ссылку на поддерево (представление
+comment_thread), которое отдаётся порциями по пути.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, Q
+
+from .models import Comment
+from .pagination import encode_cursor
+
+SEGMENT = '{:010d}'
+# 21 сегмент по 11 символов помещается в path (255)
+MAX_DEPTH = 20
+VISIBLE_DEPTH = 3
+INLINE_LIMIT = 50
+# отступ ответа на странице не растёт бесконечно
+MAX_INDENT = 6
+
+
+def node_path(comment):
+    return comment.path or SEGMENT.format(comment.pk)
+
+
+def subtree_filter(comment):
+    path = node_path(comment)
+    return Q(path__gt=f'{path}/', path__lt=f'{path}0')
+
+
+def ancestor_ids(comment):
+    return [int(segment) for segment in comment.path.split('/')[:-1]]
+
+
+def root_id(comment):
+    return int(node_path(comment).split('/')[0])
+
+
+def place(comment):
+    """До вставки ответа: глубина, слишком глубокие идут к предку."""
+    parent = comment.parent
+    while parent.depth >= MAX_DEPTH:
+        parent = parent.parent
+    comment.parent = parent
+    comment.post_id = parent.post_id
+    comment.depth = parent.depth + 1
+
+
+def attach(comment):
+    """После вставки ответа: путь и счётчики ответов предков."""
+    comment.path = f'{node_path(comment.parent)}/{SEGMENT.format(comment.pk)}'
+    Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+    Comment.objects.filter(pk__in=ancestor_ids(comment)).update(
+        reply_count=F('reply_count') + 1
+    )
+
+
+def detach(comment):
+    # вместе с веткой предки могут уже быть удалены: UPDATE их пропустит
+    if comment.path:
+        Comment.objects.filter(pk__in=ancestor_ids(comment)).update(
+            reply_count=F('reply_count') - 1
+        )
+
+
+def _decorate(comment, limit):
+    comment.indent = min(comment.depth, MAX_INDENT)
+    comment.collapsed = comment.reply_count > 0 and (
+        comment.depth >= limit
+        or comment.depth == 0 and comment.reply_count > INLINE_LIMIT
+    )
+    comment.thread = []
+
+
+def attach_replies(roots):
+    """
+    Раскладывает по корневым комментариям (атрибут thread) их ответы
+    до VISIBLE_DEPTH уровня одним запросом по диапазонам путей.
+    """
+    for root in roots:
+        _decorate(root, VISIBLE_DEPTH)
+    opened = {
+        node_path(root): root for root in roots
+        if root.reply_count and not root.collapsed
+    }
+    if not opened:
+        return roots
+    replies = Comment.objects.filter(
+        reduce(or_, (subtree_filter(root) for root in opened.values())),
+        depth__lte=VISIBLE_DEPTH
+    ).select_related('author')
+    # OR диапазонов база не отдаёт в порядке индекса, сортируем здесь
+    for reply in sorted(replies, key=lambda reply: reply.path):
+        _decorate(reply, VISIBLE_DEPTH)
+        opened[reply.path.split('/')[0]].thread.append(reply)
+    return roots
+
+
+def subtree(comment):
+    """Ответы под comment до VISIBLE_DEPTH уровней ниже него."""
+    return Comment.objects.filter(
+        subtree_filter(comment), depth__lte=comment.depth + VISIBLE_DEPTH
+    ).select_related('author')
+
+
+def decorate_subtree(comment, replies):
+    for reply in replies:
+        _decorate(reply, comment.depth + VISIBLE_DEPTH)
+    return replies
+
+
+def root_cursor(comment):
+    """
+    Курсор ленты комментариев «сначала новые», с которого первой
+    строкой идёт ветка comment: строки строго после (created, id + 1).
+    """
+    root = Comment.objects.values_list('created', 'id').get(
+        pk=root_id(comment)
+    )
+    return encode_cursor([root[0], root[1] + 1])
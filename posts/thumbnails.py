@@ -0,0 +1,150 @@
+"""
+Миниатюры записей рендерятся вне запроса.
+
+Бэкенд sorl подменён (THUMBNAIL_BACKEND): при рендеринге шаблона
+готовая миниатюра берётся из key-value хранилища sorl, а если её
+ещё нет, работа ставится в очередь локального пула потоков и тег
+{% thumbnail %} отдаёт блок {% empty %} с заглушкой. Загрузка
+картинки в new_post/post_edit сразу ставит в очередь все размеры
+из THUMBNAIL_PREGENERATE и построение адаптивных вариантов.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.images import ImageFile
+
+from . import pagecache, variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = set()
+_executor = None
+
+
+def _rendering_allowed():
+    return getattr(_local, 'worker', False) or not getattr(
+        settings, 'THUMBNAIL_QUEUE', True
+    )
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    def _normalize(self, source, options):
+        # те же значения по умолчанию, что в ThumbnailBackend.get_thumbnail,
+        # иначе имя файла миниатюры не совпадёт
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if _rendering_allowed() or not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._normalize(source, dict(options))
+        )
+        cached = default.kvstore.get(ImageFile(name, default.storage))
+        if cached:
+            return cached
+        enqueue(source.name, geometry_string, options)
+        return None
+
+
+def _render(name, geometry, options):
+    _local.worker = True
+    try:
+        default.backend.get_thumbnail(name, geometry, **options)
+        # закэшированные карточки и страницы с заглушкой больше не читаются
+        Post.objects.filter(image=name).update(version=F('version') + 1)
+        pagecache.bump_posts(Post.objects.filter(image=name))
+    except Exception:
+        logger.exception('Не удалось построить миниатюру %s', name)
+    finally:
+        _local.worker = False
+        with _lock:
+            _pending.discard(_key(name, geometry, options))
+
+
+def _work(name, geometry, options):
+    _render(name, geometry, options)
+    # у потока пула своё соединение с базой для key-value хранилища sorl
+    close_old_connections()
+
+
+def _key(name, geometry, options):
+    return name, geometry, tuple(sorted(options.items()))
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def enqueue(name, geometry, options):
+    """Ставит миниатюру в очередь, повторные заявки не дублируются."""
+    key = _key(name, geometry, options)
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    if getattr(settings, 'THUMBNAIL_QUEUE', True):
+        _get_executor().submit(_work, name, geometry, dict(options))
+    else:
+        _render(name, geometry, dict(options))
+
+
+def _call(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', func)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args):
+    """Выполняет func в пуле миниатюр (или сразу без очереди)."""
+    if getattr(settings, 'THUMBNAIL_QUEUE', True):
+        _get_executor().submit(_call, func, args)
+    else:
+        func(*args)
+
+
+def schedule(post):
+    """
+    После коммита ставит в очередь все размеры картинки записи
+    и её адаптивные варианты (см. variants.py).
+    """
+    if not post.image:
+        return
+    name = post.image.name
+    sizes = getattr(settings, 'THUMBNAIL_PREGENERATE', ())
+
+    def submit_all():
+        for geometry, options in sizes:
+            enqueue(name, geometry, options)
+        submit(variants.build, post.pk, name)
+
+    transaction.on_commit(submit_all)
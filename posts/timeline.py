@@ -0,0 +1,79 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Каждая запись автора раскладывается в TimelineEntry всех его
+подписчиков в момент публикации, поэтому follow_index читает один
+диапазон индекса (user, -pub_date, -post) вместо IN-подзапроса
+по подпискам с сортировкой.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow, Post, TimelineEntry
+
+
+def batch_size():
+    return getattr(settings, 'TIMELINE_BATCH_SIZE', 1000)
+
+
+def _write(entries, size=None):
+    """Пишет записи ленты пачками, уже существующие пропускаются."""
+    size = size or batch_size()
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk = []
+    if chunk:
+        TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+
+
+def fan_out(posts):
+    """Раскладывает новые записи в ленты подписчиков их авторов."""
+    by_author = {}
+    for post in posts:
+        by_author.setdefault(post.author_id, []).append(post)
+    if not by_author:
+        return
+    followers = Follow.objects.filter(
+        author_id__in=by_author
+    ).values_list('author_id', 'user_id').iterator(chunk_size=batch_size())
+    _write(
+        TimelineEntry(user_id=user_id, post_id=post.id,
+                      pub_date=post.pub_date)
+        for author_id, user_id in followers
+        for post in by_author[author_id]
+    )
+
+
+def backfill(user_id, author_id, size=None):
+    """Добавляет в ленту нового подписчика все записи автора."""
+    size = size or batch_size()
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    ).iterator(chunk_size=size)
+    _write(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        size
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты записи автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+def rebuild(size=None):
+    """Полностью пересобирает таблицу лент по текущим подпискам."""
+    size = size or batch_size()
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        follows = list(Follow.objects.values_list('user_id', 'author_id'))
+        for user_id, author_id in follows:
+            backfill(user_id, author_id, size)
+    return TimelineEntry.objects.count()
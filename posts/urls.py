@@ -7,6 +7,7 @@ urlpatterns = [
     path('follow/', views.follow_index, name='follow_index'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
     path('<username>/follow/', views.profile_follow, name='profile_follow'),
     path(
         '<username>/unfollow/',
@@ -17,6 +18,16 @@ urlpatterns = [
     path('<username>/following/', views.following_view, name='following_view'),
     path('<username>/', views.profile_view, name='profile_view'),
     path('<username>/<int:post_id>/', views.post_view, name='post_view'),
+    path(
+        '<username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path(
+        '<username>/<int:post_id>/comments/<int:comment_id>/',
+        views.comment_thread,
+        name='comment_thread'
+    ),
     path('<username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
         '<username>/<int:post_id>/comment/',
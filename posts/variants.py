@@ -0,0 +1,163 @@
+"""
+Адаптивные варианты картинок записей.
+
+Для каждой Post.image строится набор ширин IMAGE_VARIANT_WIDTHS
+в форматах IMAGE_VARIANT_FORMATS с тем же кадрированием, что у
+карточки ленты (IMAGE_VARIANT_RATIO). Описание файлов хранится
+в Post.image_variants в JSON; шаблон post_item.html собирает из него
+<picture> с srcset/sizes. Пока варианты не готовы, карточка
+показывает миниатюру sorl.
+"""
+import json
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TO = 'posts/variants/'
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def widths():
+    return getattr(
+        settings, 'IMAGE_VARIANT_WIDTHS', [320, 480, 640, 960, 1280, 1920]
+    )
+
+
+def ratio():
+    return getattr(settings, 'IMAGE_VARIANT_RATIO', (960, 339))
+
+
+def formats():
+    """Форматы в порядке предпочтения; WebP — если Pillow его умеет."""
+    wanted = getattr(settings, 'IMAGE_VARIANT_FORMATS', ['webp', 'jpeg'])
+    return [
+        name for name in wanted
+        if name != 'webp' or features.check('webp')
+    ]
+
+
+def quality():
+    return getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+
+
+def _target_widths(source_width):
+    """Ширины без увеличения исходника; хотя бы одна есть всегда."""
+    fitting = [width for width in widths() if width <= source_width]
+    return fitting or widths()[:1]
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    options = {'quality': quality()}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    else:
+        options['method'] = 4
+    image.save(buffer, PIL_FORMATS[fmt], **options)
+    return buffer.getvalue()
+
+
+def render(name):
+    """
+    Строит все варианты файла name и возвращает их описание:
+    {'source', 'width', 'height', 'files': {формат: [[w, h, имя]]}}.
+    """
+    ratio_width, ratio_height = ratio()
+    with default_storage.open(name) as source_file:
+        source = Image.open(source_file)
+        source = ImageOps.exif_transpose(source).convert('RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    files = {fmt: [] for fmt in formats()}
+    for width in _target_widths(source.width):
+        height = round(width * ratio_height / ratio_width)
+        image = ImageOps.fit(source, (width, height), Image.LANCZOS)
+        for fmt in files:
+            saved = default_storage.save(
+                f'{UPLOAD_TO}{stem}-{width}.{fmt}',
+                ContentFile(_encode(image, fmt))
+            )
+            files[fmt].append([width, height, saved])
+    return {
+        'source': name,
+        'width': ratio_width,
+        'height': ratio_height,
+        'files': files,
+    }
+
+
+def _delete_files(raw):
+    if not raw:
+        return
+    for entries in json.loads(raw)['files'].values():
+        for _, _, name in entries:
+            default_storage.delete(name)
+
+
+def build(post_id, name):
+    """
+    Фоновая задача: строит варианты и сохраняет описание в записи,
+    если за это время картинку не успели заменить.
+    """
+    from . import pagecache
+    from .models import Post
+
+    current = Post.objects.filter(pk=post_id).values_list(
+        'image', 'image_variants'
+    ).first()
+    if current is None or current[0] != name:
+        return False
+    previous = current[1]
+    data = render(name)
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image_variants=json.dumps(data), version=F('version') + 1
+    )
+    if not updated:
+        # картинку заменили, пока строились варианты
+        _delete_files(json.dumps(data))
+        return False
+    pagecache.bump_posts(Post.objects.filter(pk=post_id))
+    try:
+        _delete_files(previous)
+    except (OSError, ValueError, KeyError):
+        logger.warning('Не удалось удалить старые варианты записи %s', post_id)
+    return True
+
+
+def picture(raw, name):
+    """
+    Разворачивает Post.image_variants для шаблона: srcset по
+    форматам, запасной src и размеры. None, если вариантов нет
+    или они построены для другой картинки.
+    """
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data['source'] != name:
+        return None
+    sources = []
+    fallback = None
+    for fmt, entries in data['files'].items():
+        srcset = ', '.join(
+            f'{default_storage.url(file_name)} {width}w'
+            for width, _, file_name in entries
+        )
+        sources.append({'type': f'image/{fmt}', 'srcset': srcset})
+        fallback = entries
+    # src — вариант ближайшей к карточке ширины в последнем
+    # (самом совместимом) формате
+    src = min(fallback, key=lambda entry: abs(entry[0] - data['width']))
+    return {
+        'sources': sources[:-1],
+        'srcset': sources[-1]['srcset'],
+        'src': default_storage.url(src[2]),
+        'width': data['width'],
+        'height': data['height'],
+    }
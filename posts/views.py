@@ -1,17 +1,21 @@
 from django.contrib.auth.decorators import login_required
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
-from .models import Post, Group, User, Follow
+from django.urls import reverse
+from .models import Group, User, Follow
+from . import fragments, pagecache, threads, thumbnails
 from .forms import PostForm, CommentForm
+from .counters import stats_for
+from .feeds import feed_queryset, follow_feed
+from .pagination import MAX_INT, next_chunk, paginate
+from .search import search_page
 
 
-@cache_page(20)
+@pagecache.feed_page(lambda request: ['global'])
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = feed_queryset()
+    paginator, page = paginate(request, post_list)
+    fragments.attach(request, page)
     return render(
         request,
         'index.html',
@@ -19,12 +23,14 @@ def index(request):
     )
 
 
+@pagecache.feed_page(
+    lambda request, slug: [pagecache.group_scope(slug)]
+)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = feed_queryset(group.group_posts.all())
+    paginator, page = paginate(request, posts)
+    fragments.attach(request, page)
     return render(
         request,
         'group.html',
@@ -32,6 +38,17 @@ def group_posts(request, slug):
     )
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator, page = search_page(request, query)
+    fragments.attach(request, page)
+    return render(
+        request,
+        'search.html',
+        {'query': query, 'page': page, 'paginator': paginator}
+    )
+
+
 @login_required
 def new_post(request):
     if request.method == 'POST':
@@ -40,54 +57,130 @@ def new_post(request):
             new_article = form.save(commit=False)
             new_article.author = request.user
             new_article.save()
+            thumbnails.schedule(new_article)
             return redirect('index')
         return render(request, 'new_post.html', {'form': form})
     form = PostForm()
     return render(request, 'new_post.html', {'form': form})
 
 
+@pagecache.feed_page(
+    lambda request, username: [pagecache.author_scope(username)]
+)
 def profile_view(request, username):
     profile = get_object_or_404(User, username=username)
-    articles = profile.author_posts.all()
+    articles = feed_queryset(profile.author_posts.all())
     if request.user.is_authenticated:
         user_follower_author = request.user.follower.filter(
             author__username=username
         ).exists()
     else:
         user_follower_author = False
-    paginator = Paginator(articles, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate(request, articles)
+    fragments.attach(request, page)
     context = {
         'user_follower_author': user_follower_author,
         'profile': profile,
+        'stats': stats_for(profile),
         'page': page,
         'paginator': paginator,
     }
     return render(request, 'profile_view.html', context)
 
 
-def post_view(request, username, post_id):
-    profile = get_object_or_404(User, username=username)
-    article = get_object_or_404(profile.author_posts, id=post_id)
+# порядок корневых комментариев (?order=) и ключ курсора для него;
+# оба ключа читаются по индексу comment_post_root_idx без сортировки
+COMMENT_ORDERS = {
+    'old': ('created', 'id'),
+    'new': ('-created', '-id'),
+}
+COMMENTS_PAGE_SIZE = 20
+THREAD_PAGE_SIZE = 50
+
+
+def comment_page(request, article):
+    """
+    Порция корневых комментариев к записи по курсору из ?cursor=
+    с их ветками ответов: страница не читает все комментарии,
+    а авторы приходят тем же запросом.
+    """
+    order = request.GET.get('order')
+    if order not in COMMENT_ORDERS:
+        order = 'old'
+    comments, next_query = next_chunk(
+        request, article.comments.filter(parent=None).select_related(
+            'author'
+        ),
+        COMMENT_ORDERS[order], COMMENTS_PAGE_SIZE
+    )
+    threads.attach_replies(comments)
+    args = [article.author.username, article.id]
+    return {
+        'comments': comments,
+        'comments_next': next_query,
+        'order': order,
+        'page_url': reverse('post_view', args=args),
+        'fragment_url': reverse('post_comments', args=args),
+    }
+
+
+def post_context(request, profile, article, form):
     if request.user.is_authenticated:
         user_follower_author = request.user.follower.filter(
-            author__username=username
+            author=profile
         ).exists()
     else:
         user_follower_author = False
-    comments = article.comments.all()
-    comment_form = CommentForm()
-    context = {
+    return {
         'profile': profile,
+        'stats': stats_for(profile),
         'article': article,
         'user_follower_author': user_follower_author,
-        'comments': comments,
-        'form': comment_form
+        'form': form,
+        **comment_page(request, article),
     }
+
+
+@pagecache.conditional(pagecache.post_state)
+def post_view(request, username, post_id):
+    profile = get_object_or_404(User, username=username)
+    article = get_object_or_404(profile.author_posts, id=post_id)
+    context = post_context(request, profile, article, CommentForm())
     return render(request, 'post_view.html', context)
 
 
+@pagecache.conditional(pagecache.post_state)
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев без страницы вокруг них."""
+    profile = get_object_or_404(User, username=username)
+    article = get_object_or_404(profile.author_posts, id=post_id)
+    return render(
+        request,
+        'comment_rows.html',
+        {'article': article, **comment_page(request, article)}
+    )
+
+
+@pagecache.conditional(pagecache.post_state)
+def comment_thread(request, username, post_id, comment_id):
+    """Свёрнутая ветка: ответы под комментарием порциями по пути."""
+    profile = get_object_or_404(User, username=username)
+    article = get_object_or_404(profile.author_posts, id=post_id)
+    comment = get_object_or_404(article.comments, id=comment_id)
+    replies, next_query = next_chunk(
+        request, threads.subtree(comment), ('path',), THREAD_PAGE_SIZE
+    )
+    threads.decorate_subtree(comment, replies)
+    url = reverse('comment_thread', args=[username, post_id, comment_id])
+    return render(request, 'comment_rows.html', {
+        'article': article,
+        'comments': replies,
+        'comments_next': next_query,
+        'page_url': url,
+        'fragment_url': url,
+    })
+
+
 def post_edit(request, username, post_id):
     profile = get_object_or_404(User, username=username)
     if request.user != profile:
@@ -101,8 +194,12 @@ def post_edit(request, username, post_id):
             instance=article
         )
         if form.is_valid():
-            edited_article = form.save()
-            edited_article.save()
+            edited_article = form.save(commit=False)
+            # только поля формы: счётчик комментариев, версию и варианты
+            # картинки за время запроса могли изменить UPDATE ... F()
+            edited_article.save(update_fields=form._meta.fields)
+            if 'image' in form.changed_data:
+                thumbnails.schedule(edited_article)
             return redirect('post_view', username=username, post_id=post_id)
         return render(request, 'new_post.html', {'form': form})
 
@@ -122,51 +219,56 @@ def server_error(request):
     return render(request, 'misc/500.html', status=500)
 
 
+def reply_target(request, article):
+    """Комментарий, на который отвечают (?parent= или поле parent)."""
+    parent_id = request.POST.get('parent') or request.GET.get('parent')
+    if not parent_id:
+        return None
+    # только ASCII-цифры: isdigit() пропускает '²', который int() не
+    # разберёт; SQLite не примет число больше 2**63
+    if not (parent_id.isascii() and parent_id.isdecimal()) or (
+            int(parent_id) >= MAX_INT):
+        raise Http404
+    return get_object_or_404(
+        article.comments.select_related('author'), id=parent_id
+    )
+
+
 @login_required
 def add_comment(request, username, post_id):
     profile = get_object_or_404(User, username=username)
     article = get_object_or_404(profile.author_posts, id=post_id)
-    # список комментов к посту
-    comments = article.comments.all()
-    new_comment = None
+    parent = reply_target(request, article)
     if request.method == 'POST':
         comment_form = CommentForm(
             request.POST or None,
-            files=request.FILES or None
+            files=request.FILES or None,
+            parent=parent
         )
         if comment_form.is_valid():
             new_comment = comment_form.save(commit=False)
             new_comment.author = request.user
             new_comment.post_id = article.id
             new_comment.save()
-            return redirect('post_view', username=username, post_id=post_id)
-        return render(
-            request,
-            'post_view.html',
-            {'form': comment_form}
-        )
+            # новые первыми: свой комментарий или его ветка видны
+            # в первой порции
+            query = 'order=new'
+            if parent is not None:
+                query += f'&cursor={threads.root_cursor(new_comment)}'
+            url = reverse('post_view', args=[username, post_id])
+            return redirect(f'{url}?{query}#comment_{new_comment.id}')
     else:
-        comment_form = CommentForm()
-    context = {
-        'profile': profile,
-        'article': article,
-        'comments': comments,
-        'new_comment': new_comment,
-        'form': comment_form
-    }
+        comment_form = CommentForm(parent=parent)
+    context = post_context(request, profile, article, comment_form)
     return render(request, 'post_view.html', context)
 
 
 @login_required
 def follow_index(request):
-    profile = get_object_or_404(User, username=request.user)
-    my_follower_queryset = profile.follower.values_list('author', flat=True)
-    articles = Post.objects.filter(author__in=my_follower_queryset)
-    paginator = Paginator(articles, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    profile = request.user
+    paginator, page = follow_feed(request, profile)
+    fragments.attach(request, page)
     context = {
-        'my_follower_queryset': my_follower_queryset,
         'profile': profile,
         'page': page,
         'paginator': paginator,
@@ -1,4 +1,6 @@
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
+    'tests.fixtures.fixture_cache',
+    'tests.fixtures.fixture_media',
 ]
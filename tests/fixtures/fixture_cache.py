@@ -0,0 +1,14 @@
+import shutil
+import tempfile
+
+import pytest
+
+from yatube.test_runner import temporary_cache_settings
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_cache_dir():
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    with temporary_cache_settings(directory):
+        yield directory
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,15 @@
+import shutil
+import tempfile
+
+import pytest
+from django.test.utils import override_settings
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_media_root():
+    # загрузки, миниатюры и варианты картинок не попадают в MEDIA_ROOT
+    # проекта; без очереди фоновые задачи успевают до удаления каталога
+    directory = tempfile.mkdtemp(prefix='yatube-media-')
+    with override_settings(MEDIA_ROOT=directory, THUMBNAIL_QUEUE=False):
+        yield directory
+    shutil.rmtree(directory, ignore_errors=True)
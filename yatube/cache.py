@@ -0,0 +1,334 @@
+"""
+Общий для всех процессов узла кэш в файле SQLite (режим WAL).
+
+LocMemCache у каждого воркера свой: кэш холодный после старта,
+а удаление ключа в одном воркере не видно остальным. Этот бэкенд
+хранит значения в файле LOCATION, который читают и пишут все
+процессы; WAL позволяет читателям не ждать писателя.
+
+Кроме стандартного API кэша есть get_or_recompute(): значение
+пересчитывает только процесс, взявший блокировку ключа (single
+flight), остальные либо ждут его результата, либо в пределах
+окна STALE_TIMEOUT после истечения отдают прежнее значение
+(stale-while-revalidate).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube/default.sqlite3',
+            'OPTIONS': {'STALE_TIMEOUT': 30, 'LOCK_TIMEOUT': 10},
+        },
+    }
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+# подсчёт строк дорогой, поэтому чистка идёт в среднем раз в сто записей
+CULL_PROBABILITY = 0.01
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+    ' expires REAL, stale_until REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_stale ON cache (stale_until)',
+    'CREATE TABLE IF NOT EXISTS cache_lock ('
+    ' key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)',
+)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._stale_timeout = options.get('STALE_TIMEOUT', 0)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._poll_interval = options.get('POLL_INTERVAL', 0.01)
+        self._local = threading.local()
+
+    # соединения
+
+    def _connection(self):
+        # соединение своё у каждого потока и у каждого процесса
+        # после fork, иначе SQLite повредит блокировки файла
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout,
+                isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _expiry(self, timeout):
+        # get_backend_timeout уже возвращает абсолютное время
+        return self.get_backend_timeout(timeout)
+
+    # чтение
+
+    def _fetch(self, keys):
+        """{key: (value, expires, stale_until)} для живых строк."""
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value, expires, stale_until FROM cache '
+            f'WHERE key IN ({placeholders}) '
+            f'AND (stale_until IS NULL OR stale_until > ?)',
+            [*keys, time.time()]
+        ).fetchall()
+        return {
+            key: (pickle.loads(value), expires, stale_until)
+            for key, value, expires, stale_until in rows
+        }
+
+    @staticmethod
+    def _fresh(row, now):
+        return row[1] is None or row[1] > now
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._fetch([key]).get(key)
+        if row is None or not self._fresh(row, time.time()):
+            metrics.cache_access(0, 1)
+            return default
+        metrics.cache_access(1, 0)
+        return row[0]
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        now = time.time()
+        found = {
+            made[key]: row[0]
+            for key, row in self._fetch(list(made)).items()
+            if self._fresh(row, now)
+        }
+        metrics.cache_access(len(found), len(made) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    # запись
+
+    def _write(self, key, value, timeout, stale=0, mode='REPLACE'):
+        expires = self._expiry(timeout)
+        stale_until = None if expires is None else expires + stale
+        cursor = self._connection().execute(
+            f'INSERT OR {mode} INTO cache (key, value, expires, stale_until) '
+            f'VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             expires, stale_until)
+        )
+        if random.random() < CULL_PROBABILITY:
+            self._cull()
+        return cursor.rowcount == 1
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expiry(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                         expires, expires))
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache '
+                '(key, value, expires, stale_until) VALUES (?, ?, ?, ?)',
+                rows
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # истёкшая строка не мешает add, как и в других бэкендах
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? '
+                'AND expires IS NOT NULL AND expires <= ?',
+                (key, time.time())
+            )
+            added = self._write(key, value, timeout, mode='IGNORE')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expiry(timeout)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ?, stale_until = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (expires, expires, key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection()
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: чтение
+        # и запись нового значения не перемежаются с другими процессами
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key)
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if not keys:
+            return
+        placeholders = ', '.join('?' * len(keys))
+        self._connection().execute(
+            f'DELETE FROM cache WHERE key IN ({placeholders})', keys
+        )
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM cache')
+        connection.execute('DELETE FROM cache_lock')
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute(
+            'DELETE FROM cache WHERE stale_until <= ?', (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # вытесняются ключи, которые истекут раньше других
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+    # single flight
+
+    def _acquire(self, key, owner):
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO cache_lock (key, owner, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, '
+            'expires = excluded.expires WHERE cache_lock.expires <= ?',
+            (key, owner, now + self._lock_timeout, now)
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, key, owner):
+        self._connection().execute(
+            'DELETE FROM cache_lock WHERE key = ? AND owner = ?', (key, owner)
+        )
+
+    def _recompute(self, key, compute, timeout, stale, cacheable):
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self._write(key, value, timeout, stale)
+        return value
+
+    def get_or_recompute(self, key, compute, timeout=DEFAULT_TIMEOUT,
+                         stale=None, cacheable=None, version=None):
+        """
+        Возвращает значение key, вычисляя его compute() не более чем
+        в одном процессе за раз. Пока владелец блокировки считает,
+        остальные отдают устаревшее значение (не старше stale секунд
+        после истечения) или ждут до LOCK_TIMEOUT. cacheable(value)
+        может запретить сохранение результата.
+        """
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        stale = self._stale_timeout if stale is None else stale
+        owner = uuid.uuid4().hex
+        row = self._fetch([key]).get(key)
+        if row is not None and self._fresh(row, time.time()):
+            metrics.cache_access(1, 0)
+            return row[0]
+        metrics.cache_access(0, 1)
+        if row is not None:
+            if not self._acquire(key, owner):
+                return row[0]
+            try:
+                return self._recompute(key, compute, timeout, stale, cacheable)
+            finally:
+                self._release(key, owner)
+
+        deadline = time.time() + self._lock_timeout
+        while not self._acquire(key, owner):
+            if time.time() > deadline:
+                # владелец блокировки не успел: считаем сами
+                return self._recompute(key, compute, timeout, stale, cacheable)
+            time.sleep(self._poll_interval)
+            row = self._fetch([key]).get(key)
+            if row is not None:
+                return row[0]
+        try:
+            # значение могли записать, пока мы ждали блокировку
+            row = self._fetch([key]).get(key)
+            if row is not None and self._fresh(row, time.time()):
+                return row[0]
+            return self._recompute(key, compute, timeout, stale, cacheable)
+        finally:
+            self._release(key, owner)
+
+    def close(self, **kwargs):
+        # соединения живут всё время процесса: открывать файл
+        # на каждый запрос дороже, чем держать его открытым
+        pass
@@ -0,0 +1,61 @@
+"""
+Настройка соединений SQLite при открытии (сигнал connection_created).
+
+По умолчанию SQLite пишет журнал отката: писатель блокирует всех
+читателей, а каждый коммит ждёт fsync. configure() выполняет
+PRAGMA из настройки SQLITE_PRAGMAS на каждом новом соединении:
+
+* journal_mode=wal — читатели не ждут писателя (режим хранится
+  в файле базы, повтор на следующих соединениях ничего не стоит);
+* synchronous=normal — в WAL достаточно fsync при checkpoint;
+* mmap_size, cache_size — чтение страниц через mmap и больший
+  кэш страниц соединения;
+* temp_store=memory — временные таблицы и сортировки в памяти;
+* busy_timeout — сколько мс ждать чужую блокировку вместо
+  немедленной ошибки database is locked.
+
+Вместе с CONN_MAX_AGE соединение и его настройки переживают
+запрос, так что PRAGMA выполняются раз на соединение, а не на
+каждый запрос.
+
+wrap_queries() ставит execute_wrapper на все соединения сразу:
+им пользуются метрики и профилировщик запросов.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def apply(connection, values):
+    """Выполняет PRAGMA на соединении sqlite3 (DB-API, не обёртке)."""
+    for name, value in values.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+def configure(sender, connection, **kwargs):
+    """Приёмник connection_created для соединений SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    apply(connection.connection, pragmas())
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    execute_wrapper на всех соединениях на время with-блока. Обёртка
+    встаёт в конец списка, ближе всех к запросу; обёртки, которые
+    должны быть снаружи (slowlog), ставятся в начало.
+    """
+    wrapped = [connections[alias] for alias in connections]
+    for connection in wrapped:
+        connection.execute_wrappers.append(wrapper)
+    try:
+        yield wrapper
+    finally:
+        for connection in wrapped:
+            connection.execute_wrappers.remove(wrapper)
@@ -0,0 +1,280 @@
+"""
+Метрики запросов для Prometheus без debug_toolbar.
+
+metrics_middleware считает по имени URL (index, post_view,
+api:post_list, ...) число запросов по кодам ответа, гистограмму
+времени ответа, число и время SQL-запросов, попадания и промахи
+кэша и размер ответа. Счётчики лежат в памяти процесса, запрос
+стоит несколько микросекунд; раз в METRICS_FLUSH_INTERVAL секунд
+процесс пишет снимок своих счётчиков в METRICS_DIR/<pid>.json.
+
+Представление /metrics складывает снимки всех воркеров узла и
+отдаёт их в текстовом формате Prometheus сотрудникам и сборщику
+с токеном METRICS_TOKEN (Authorization: Bearer). Снимки завершившихся
+процессов переносятся в archive.json, чтобы счётчики не убывали.
+"""
+import bisect
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import db
+
+# границы корзин гистограммы времени ответа, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ARCHIVE = 'archive.json'
+
+_lock = threading.Lock()
+_local = threading.local()
+# {view: {'requests': {status: n}, 'buckets': [...], ...}}
+_views = {}
+_last_flush = 0.0
+
+
+def directory():
+    return getattr(
+        settings, 'METRICS_DIR', os.path.join(settings.CACHE_DIR, 'metrics')
+    )
+
+
+def flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def _empty():
+    return {
+        'requests': {},
+        'buckets': [0] * (len(BUCKETS) + 1),
+        'seconds': 0.0,
+        'db_queries': 0,
+        'db_seconds': 0.0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'response_bytes': 0,
+    }
+
+
+class _Request:
+    __slots__ = ('queries', 'db_seconds', 'hits', 'misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # обёртка execute_wrapper: время и число SQL-запросов
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def cache_access(hits, misses):
+    """Вызывается бэкендом кэша; вне запроса ничего не делает."""
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current.hits += hits
+        current.misses += misses
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def record(view, status, seconds, current, size):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = _empty()
+        status = str(status)
+        stats['requests'][status] = stats['requests'].get(status, 0) + 1
+        stats['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+        stats['seconds'] += seconds
+        stats['db_queries'] += current.queries
+        stats['db_seconds'] += current.db_seconds
+        stats['cache_hits'] += current.hits
+        stats['cache_misses'] += current.misses
+        stats['response_bytes'] += size
+
+
+def metrics_middleware(get_response):
+    def middleware(request):
+        current = _Request()
+        _local.request = current
+        started = time.perf_counter()
+        try:
+            with db.wrap_queries(current):
+                response = get_response(request)
+        finally:
+            _local.request = None
+        size = 0 if response.streaming else len(response.content)
+        record(
+            _view_name(request), response.status_code,
+            time.perf_counter() - started, current, size
+        )
+        if time.monotonic() - _last_flush > flush_interval():
+            flush()
+        return response
+    return middleware
+
+
+def _write_json(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(data, output)
+    os.replace(temporary, path)
+
+
+def flush():
+    """Пишет снимок счётчиков процесса в METRICS_DIR/<pid>.json."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    with _lock:
+        snapshot = json.loads(json.dumps(_views))
+    os.makedirs(directory(), exist_ok=True)
+    _write_json(os.path.join(directory(), f'{os.getpid()}.json'), snapshot)
+
+
+def _merge(total, snapshot):
+    for view, stats in snapshot.items():
+        target = total.setdefault(view, _empty())
+        for status, count in stats['requests'].items():
+            target['requests'][status] = (
+                target['requests'].get(status, 0) + count
+            )
+        target['buckets'] = [
+            a + b for a, b in zip(target['buckets'], stats['buckets'])
+        ]
+        for key in ('seconds', 'db_queries', 'db_seconds', 'cache_hits',
+                    'cache_misses', 'response_bytes'):
+            target[key] += stats[key]
+    return total
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return {}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Сумма снимков всех процессов; мёртвые переносятся в архив."""
+    flush()
+    root = directory()
+    with open(os.path.join(root, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = _read(os.path.join(root, ARCHIVE))
+        total = _merge({}, archive)
+        dead = []
+        for name in os.listdir(root):
+            stem, extension = os.path.splitext(name)
+            pid = stem.isascii() and stem.isdecimal()
+            if extension != '.json' or not pid:
+                continue
+            snapshot = _read(os.path.join(root, name))
+            _merge(total, snapshot)
+            if not _alive(int(stem)):
+                _merge(archive, snapshot)
+                dead.append(name)
+        if dead:
+            _write_json(os.path.join(root, ARCHIVE), archive)
+            for name in dead:
+                os.remove(os.path.join(root, name))
+    return total
+
+
+def _labels(**labels):
+    return ','.join(
+        f'{key}="{value}"' for key, value in sorted(labels.items())
+    )
+
+
+def render(total):
+    """Текстовый формат Prometheus."""
+    lines = []
+
+    def family(name, kind, text):
+        lines.append(f'# HELP yatube_{name} {text}')
+        lines.append(f'# TYPE yatube_{name} {kind}')
+
+    family('requests_total', 'counter', 'Запросы по имени URL и коду')
+    for view, stats in sorted(total.items()):
+        for status, count in sorted(stats['requests'].items()):
+            lines.append(
+                f'yatube_requests_total{{{_labels(view=view, status=status)}}}'
+                f' {count}'
+            )
+    family('request_duration_seconds', 'histogram', 'Время ответа')
+    for view, stats in sorted(total.items()):
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), stats['buckets']):
+            cumulative += count
+            lines.append(
+                f'yatube_request_duration_seconds_bucket'
+                f'{{{_labels(view=view, le=bound)}}} {cumulative}'
+            )
+        lines.append(
+            f'yatube_request_duration_seconds_sum{{{_labels(view=view)}}} '
+            f'{stats["seconds"]}'
+        )
+        lines.append(
+            f'yatube_request_duration_seconds_count{{{_labels(view=view)}}} '
+            f'{cumulative}'
+        )
+    for key, kind, text in (
+        ('db_queries', 'counter', 'SQL-запросы'),
+        ('db_seconds', 'counter', 'Время SQL-запросов'),
+        ('cache_hits', 'counter', 'Попадания в кэш'),
+        ('cache_misses', 'counter', 'Промахи кэша'),
+        ('response_bytes', 'counter', 'Размер ответов'),
+    ):
+        family(f'{key}_total', kind, text)
+        for view, stats in sorted(total.items()):
+            lines.append(
+                f'yatube_{key}_total{{{_labels(view=view)}}} {stats[key]}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def _token_valid(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return False
+    given = request.META.get('HTTP_AUTHORIZATION', '')
+    return hmac.compare_digest(given.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    """
+    Метрики всех воркеров узла для сотрудников и запросов с токеном
+    METRICS_TOKEN. Адрес клиента не проверяется: за прокси на том же
+    узле все запросы приходят с 127.0.0.1.
+    """
+    if not (request.user.is_staff or _token_valid(request)):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(collect()), content_type='text/plain; version=0.0.4'
+    )
@@ -0,0 +1,160 @@
+"""
+Профилирование отдельных запросов на рабочем сервере.
+
+profiler_middleware профилирует запрос, если сотрудник прислал
+заголовок X-Profile: 1 или если запрос попал в долю
+PROFILER_SAMPLE_RATE. Во время запроса фоновый поток раз в
+PROFILER_INTERVAL секунд снимает стек потока запроса
+(sys._current_frames) — это выборочный профилировщик, в отличие
+от cProfile он не замедляет каждый вызов функции. Заодно
+execute_wrapper записывает все SQL-запросы и их время.
+
+Результат ложится в PROFILER_DIR двумя файлами с общим именем
+<время>-<имя URL>-<pid>:
+
+* .collapsed — стеки в свёрнутом формате (frame;frame;... count),
+  который читают flamegraph.pl и speedscope; корневой кадр
+  view:<имя URL> позволяет сливать файлы разных страниц;
+* .json — адрес, время ответа и SQL-запросы с длительностью.
+
+В каталоге хранится не больше PROFILER_MAX_FILES профилей, старые
+удаляются. Имя профиля возвращается в заголовке X-Profile-Id.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from . import db
+
+HEADER = 'HTTP_X_PROFILE'
+
+
+def directory():
+    return getattr(
+        settings, 'PROFILER_DIR', os.path.join(settings.CACHE_DIR, 'profiles')
+    )
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+
+
+def interval():
+    return getattr(settings, 'PROFILER_INTERVAL', 0.001)
+
+
+def max_files():
+    return getattr(settings, 'PROFILER_MAX_FILES', 200)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+class Sampler:
+    """Снимает стеки потока thread_id, пока работает with-блок."""
+    def __init__(self, thread_id, every):
+        self.thread_id = thread_id
+        self.every = every
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.every):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class _Queries:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+def wanted(request):
+    if request.META.get(HEADER) == '1' and request.user.is_staff:
+        return True
+    rate = sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+def _rotate(root):
+    stems = sorted({
+        os.path.splitext(name)[0] for name in os.listdir(root)
+        if name.endswith(('.collapsed', '.json'))
+    })
+    for stem in stems[:-max_files()]:
+        for extension in ('.collapsed', '.json'):
+            try:
+                os.remove(os.path.join(root, stem + extension))
+            except FileNotFoundError:
+                pass
+
+
+def save(view, request, seconds, stacks, queries):
+    """Пишет профиль в PROFILER_DIR и возвращает его имя."""
+    root = directory()
+    os.makedirs(root, exist_ok=True)
+    stem = f'{time.time():.6f}-{view.replace(":", ".")}-{os.getpid()}'
+    with open(os.path.join(root, f'{stem}.collapsed'), 'w') as output:
+        for stack, count in stacks.most_common():
+            output.write(f'view:{view};{stack} {count}\n')
+    with open(os.path.join(root, f'{stem}.json'), 'w') as output:
+        json.dump({
+            'view': view,
+            'path': request.get_full_path(),
+            'ms': round(seconds * 1000, 3),
+            'samples': sum(stacks.values()),
+            'queries': queries,
+        }, output, ensure_ascii=False, indent=1)
+    _rotate(root)
+    return stem
+
+
+def profiler_middleware(get_response):
+    def middleware(request):
+        if not wanted(request):
+            return get_response(request)
+        started = time.perf_counter()
+        with db.wrap_queries(_Queries()) as recorder:
+            with Sampler(threading.get_ident(), interval()) as sampler:
+                response = get_response(request)
+        match = request.resolver_match
+        stem = save(
+            match.view_name if match is not None else 'unmatched',
+            request, time.perf_counter() - started,
+            sampler.stacks, recorder.queries
+        )
+        response['X-Profile-Id'] = stem
+        return response
+    return middleware
@@ -0,0 +1,115 @@
+"""
+Чтение с реплик и запись в основную базу.
+
+ReplicaRouter отправляет на реплику только чтение моделей приложений
+REPLICA_APPS в GET- и HEAD-запросах к представлениям REPLICA_VIEWS
+(ленты и профили); всё остальное, в том числе чтение в POST перед
+записью, идёт в default. Реплика на запрос выбирается одна из
+DATABASE_REPLICAS. Реплики — копии основной базы, которые обновляет
+команда sync_replica, поэтому они отстают. Чтобы пользователь не
+терял собственные изменения, работает «прилипание»:
+
+* запись в запросе переводит остальные чтения этого запроса
+  на default;
+* replica_middleware после такого запроса запоминает в сессии
+  срок REPLICA_PIN_SECONDS, и до его истечения запросы этой
+  сессии читают из default.
+
+Общие кэши не должны хранить прочитанное с реплики под ключами
+свежих данных: страницы лент добавляют к своим поколениям
+поколение реплики (current_replica(), его увеличивает
+sync_replica), а кэши последних записей и карточек не
+заполняются при чтении с реплики.
+
+Вне запроса (команды, фоновые потоки миниатюр) всё читается
+из default: там реплике некому доверять.
+
+    DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+    DATABASE_REPLICAS = ['replica']
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+PIN_KEY = '_replica_pinned_until'
+# пользователи и сессии читаются из default: устаревший хэш пароля
+# на реплике разлогинивал бы пользователя при проверке сессии
+REPLICA_APPS = ('posts',)
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def replica_views():
+    return getattr(settings, 'REPLICA_VIEWS', ())
+
+
+def current_replica():
+    """Реплика, с которой читает текущий запрос, или None."""
+    return getattr(_state, 'replica', None)
+
+
+def _readonly_view(request):
+    if request.method not in SAFE_METHODS:
+        return False
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return match.view_name in replica_views()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica is None or model._meta.app_label not in REPLICA_APPS:
+            return 'default'
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # дальше в этом запросе читаем то, что только что записали
+        _state.replica = None
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии default, объекты из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+def replica_middleware(get_response):
+    """
+    Разрешает чтение с реплики на время GET-запроса к представлению
+    из REPLICA_VIEWS, если сессия не прилипла к основной базе после
+    недавней записи.
+    """
+    def middleware(request):
+        _state.replica = None
+        if (replicas() and request.session.get(PIN_KEY, 0) <= time.time()
+                and _readonly_view(request)):
+            _state.replica = random.choice(replicas())
+        _state.wrote = False
+        try:
+            response = get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.replica = None
+            _state.wrote = False
+        if wrote and replicas():
+            request.session[PIN_KEY] = time.time() + pin_seconds()
+        return response
+    return middleware
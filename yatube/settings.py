@@ -39,8 +39,8 @@ ALLOWED_HOSTS = [
 INSTALLED_APPS = [
     "users",
     "posts",
+    "api",
     "django.contrib.staticfiles",
-    "debug_toolbar",
     "django.contrib.sites",
     "django.contrib.flatpages",
     "django.contrib.admin",
@@ -52,16 +52,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы время ответа включало все остальные слои
+    'yatube.metrics.metrics_middleware',
+    'yatube.slowlog.slowlog_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'yatube.routers.replica_middleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # после аутентификации: заголовок X-Profile принимается от сотрудников
+    'yatube.profiler.profiler_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# debug_toolbar только для разработки, в продакшене — /metrics
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -91,8 +101,47 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'NAME': os.environ.get(
+            'YATUBE_DB', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+        # соединение живёт между запросами вместе с настройками PRAGMA
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 600)),
+    },
+    # копия default для чтения лент, обновляется командой sync_replica
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'YATUBE_REPLICA_DB', os.path.join(BASE_DIR, 'db.replica.sqlite3')
+        ),
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 600)),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# чтение с реплик и запись в default, см. yatube/routers.py
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+# алиасы реплик для чтения; пустой список — всё читается из default
+DATABASE_REPLICAS = [
+    alias for alias in os.environ.get('YATUBE_DB_REPLICAS', '').split(',')
+    if alias
+]
+# сколько секунд после записи сессия читает из default
+REPLICA_PIN_SECONDS = 10
+# только эти представления (GET и HEAD) читают с реплик
+REPLICA_VIEWS = (
+    'index', 'group_posts', 'profile_view', 'follower_view',
+    'following_view', 'follow_index',
+)
+
+# PRAGMA для каждого нового соединения SQLite, см. yatube/db.py
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    # отрицательное значение — размер в КиБ, а не в страницах
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+    'busy_timeout': 5000,
 }
 
 
@@ -155,12 +204,55 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# общий для воркеров узла кэш в файлах SQLite, см. yatube/cache.py
+CACHE_DIR = os.environ.get('YATUBE_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+# тесты переносят CACHE_DIR во временный каталог, см. yatube/test_runner.py
+TEST_RUNNER = 'yatube.test_runner.TempCacheRunner'
+
 CACHES = {
         'default': {
-                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        }
+                'BACKEND': 'yatube.cache.SQLiteCache',
+                'LOCATION': os.path.join(CACHE_DIR, 'default.sqlite3'),
+                'OPTIONS': {
+                        'MAX_ENTRIES': 100000,
+                        'STALE_TIMEOUT': 30,
+                        'LOCK_TIMEOUT': 10,
+                },
+        },
+        # списки последних записей авторов для движка ленты merge
+        'feeds': {
+                'BACKEND': 'yatube.cache.SQLiteCache',
+                'LOCATION': os.path.join(CACHE_DIR, 'feeds.sqlite3'),
+                'TIMEOUT': None,
+                'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+        # отрендеренные карточки записей, см. posts/fragments.py
+        'fragments': {
+                'BACKEND': 'yatube.cache.SQLiteCache',
+                'LOCATION': os.path.join(CACHE_DIR, 'fragments.sqlite3'),
+                'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
 }
 
+# снимки метрик воркеров для /metrics, см. yatube/metrics.py
+METRICS_DIR = os.path.join(CACHE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+# /metrics видят сотрудники и сборщик с заголовком
+# Authorization: Bearer <METRICS_TOKEN>; без токена — только сотрудники
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN')
+
+# профили запросов по X-Profile: 1 от сотрудников или по доле
+# запросов, см. yatube/profiler.py
+PROFILER_DIR = os.path.join(CACHE_DIR, 'profiles')
+PROFILER_SAMPLE_RATE = 0
+PROFILER_INTERVAL = 0.001
+PROFILER_MAX_FILES = 200
+
+# SQL дольше SLOW_QUERY_MS мс пишется с планом в SLOW_QUERY_LOG,
+# None выключает журнал; сводка: manage.py slow_queries
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = os.path.join(CACHE_DIR, 'slow_queries.ndjson')
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -170,3 +262,34 @@ INTERNAL_IPS = [
 #    # '...
 #}
 
+# размер пачки при раскладке записей по лентам подписчиков
+TIMELINE_BATCH_SIZE = 1000
+
+# движок ленты подписок: timeline, merge или query (см. posts/feeds.py)
+FEED_ENGINE = 'timeline'
+# сколько последних записей автора держать в кэше для движка merge
+FEED_RECENT_POSTS = 200
+FEED_RECENT_CACHE = 'feeds'
+
+# миниатюры строятся в фоне, см. posts/thumbnails.py;
+# THUMBNAIL_QUEUE = False возвращает синхронный рендеринг в шаблоне
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_QUEUE = True
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_PREGENERATE = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+
+# адаптивные варианты картинок записей, см. posts/variants.py
+IMAGE_VARIANT_WIDTHS = [320, 480, 640, 960, 1280, 1920]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_RATIO = (960, 339)
+IMAGE_VARIANT_QUALITY = 80
+
+# кэш карточек записей: ключи версионные, TIMEOUT лишь вытесняет старые
+FRAGMENT_CACHE = 'fragments'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# страницы лент кэшируются по поколениям, см. posts/pagecache.py
+PAGE_CACHE = 'default'
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
@@ -0,0 +1,159 @@
+"""
+Журнал медленных SQL-запросов с планом выполнения.
+
+install() (приёмник connection_created) ставит на каждое соединение
+execute_wrapper, который замеряет запрос и, если тот дольше
+SLOW_QUERY_MS миллисекунд, дописывает строку JSON в SLOW_QUERY_LOG:
+
+* view — имя URL запроса, в котором выполнялся SQL
+  (slowlog_middleware запоминает запрос в потоке);
+* fingerprint — нормализованный текст: числа и строки заменены
+  на ?, списки IN (%s, %s, ...) свёрнуты, пробелы схлопнуты,
+  так что запросы с разными значениями попадают в одну группу;
+* params, ms и plan — вывод EXPLAIN QUERY PLAN для SELECT,
+  выполненного на том же соединении сразу после запроса.
+
+Быстрый запрос стоит два вызова perf_counter. Команда slow_queries
+группирует журнал по fingerprint: число, суммарное время и p95.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+_local = threading.local()
+
+_SPACES = re.compile(r'\s+')
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def threshold():
+    return getattr(settings, 'SLOW_QUERY_MS', 100)
+
+
+def log_path():
+    return getattr(
+        settings, 'SLOW_QUERY_LOG',
+        os.path.join(settings.CACHE_DIR, 'slow_queries.ndjson')
+    )
+
+
+def fingerprint(sql):
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LISTS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _view_name():
+    request = getattr(_local, 'request', None)
+    if request is None:
+        return 'background'
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def explain(connection, sql, params):
+    """План SELECT; курсор create_cursor() минует execute_wrappers."""
+    statement = sql.split(None, 1)[0].upper() if sql.strip() else ''
+    if connection.vendor != 'sqlite' or statement not in ('SELECT', 'WITH'):
+        return []
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as error:
+        return [f'EXPLAIN не выполнен: {error}']
+    finally:
+        cursor.close()
+
+
+def write(entry):
+    path = log_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+    # одна запись в режиме O_APPEND: строки воркеров не перемешиваются
+    with open(path, 'a') as output:
+        output.write(line)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        limit = threshold()
+        if limit is not None and ms >= limit:
+            write({
+                'at': time.time(),
+                'view': _view_name(),
+                'fingerprint': fingerprint(sql),
+                'sql': sql,
+                'params': f'{len(params)} наборов' if many else params,
+                'ms': round(ms, 3),
+                'plan': [] if many else explain(
+                    context['connection'], sql, params
+                ),
+            })
+
+
+def install(sender, connection, **kwargs):
+    """Приёмник connection_created: обёртка ставится один раз."""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        # снаружи остальных: db.wrap_queries ставит обёртки метрик
+        # и профилировщика в конец списка
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
+
+
+def slowlog_middleware(get_response):
+    def middleware(request):
+        _local.request = request
+        try:
+            return get_response(request)
+        finally:
+            _local.request = None
+    return middleware
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+def aggregate(lines):
+    """Группы по fingerprint, самые дорогие по суммарному времени первыми."""
+    groups = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'timings': [],
+            'views': set(),
+        })
+        group['timings'].append(entry['ms'])
+        group['views'].add(entry['view'])
+        # самый медленный пример с его параметрами и планом
+        if entry['ms'] >= max(group['timings']):
+            group['sample'] = entry
+    result = []
+    for group in groups.values():
+        timings = group.pop('timings')
+        group.update(
+            count=len(timings),
+            total_ms=round(sum(timings), 3),
+            p95_ms=_percentile(timings, 95),
+            views=sorted(group['views']),
+        )
+        result.append(group)
+    return sorted(result, key=lambda group: -group['total_ms'])
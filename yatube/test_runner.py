@@ -0,0 +1,55 @@
+"""
+Запуск тестов с кэшем во временном каталоге.
+
+Кэши (yatube/cache.py), метрики, профили и журнал медленных
+запросов лежат в CACHE_DIR. Тесты очищают кэши и пишут в эти
+каталоги, поэтому с общим BASE_DIR/.cache они стирали бы кэш
+запущенного для разработки сервера, а его остатки попадали бы
+в результаты тестов. TempCacheRunner (TEST_RUNNER) и фикстура
+pytest из tests/fixtures переносят все такие пути в свежий
+временный каталог на время прогона.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# настройки с путями внутри CACHE_DIR
+PATH_SETTINGS = ('METRICS_DIR', 'PROFILER_DIR', 'SLOW_QUERY_LOG')
+
+
+def _rebase(path, directory):
+    relative = os.path.relpath(path, settings.CACHE_DIR)
+    if relative.startswith(os.pardir):
+        return path
+    return os.path.join(directory, relative)
+
+
+def temporary_cache_settings(directory):
+    """Настройки кэшей и каталогов, перенесённые из CACHE_DIR в directory."""
+    caches = copy.deepcopy(settings.CACHES)
+    for options in caches.values():
+        if options.get('LOCATION'):
+            options['LOCATION'] = _rebase(options['LOCATION'], directory)
+    values = {'CACHE_DIR': directory, 'CACHES': caches}
+    for name in PATH_SETTINGS:
+        if hasattr(settings, name):
+            values[name] = _rebase(getattr(settings, name), directory)
+    return override_settings(**values)
+
+
+class TempCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+        self._cache_settings = temporary_cache_settings(self._cache_dir)
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
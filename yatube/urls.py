@@ -5,6 +5,7 @@ from django.contrib.flatpages import views
 from django.contrib import admin
 from django.urls import include, path
 
+from yatube.metrics import metrics_view
 
 urlpatterns = [
     path("auth/", include("users.urls")),
@@ -25,6 +26,8 @@ urlpatterns = [
         {'url': '/about-spec/'},
         name='about-spec'
         ),
+    path("metrics", metrics_view, name="metrics"),
+    path("api/v1/", include("api.urls")),
     path("", include("posts.urls")),
 ]
 